@@ -0,0 +1,277 @@
+"""
+Сквозной бенчмарк обхода каталога на локальной заглушке API (stub_api.py).
+Для каждого размера синтетического каталога отдельно измеряются обход дерева, получение
+деталей перечней, проверка деталей и скорость записи в базу. Каждый размер выполняется
+в отдельном процессе и рабочем каталоге, поэтому пиковый RSS и база не смешиваются между размерами.
+
+Запуск:
+    python benchmarks/bench.py --sizes 1k,100k --catalog lemken
+    python benchmarks/bench.py --sizes 1m --validate_limit 50000 --latency 0.005
+Результаты пишутся в JSON (по умолчанию benchmarks/results/<commit>.json) для сравнения между коммитами.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from multiprocessing import get_context
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SIZES = {'1k': 1_000, '100k': 100_000, '1m': 1_000_000}
+
+
+def tree_shape(catalog_name, parts_total, roots=5, parts=20):
+    """
+    Подбирает fanout так, чтобы число деталей каталога было близко к parts_total.
+    """
+    from src.catalog import catalog as catalog_module
+
+    depth = getattr(catalog_module, f'{catalog_name.capitalize()}Catalog').depth
+    parts_lists = max(roots, parts_total // parts)
+    fanout = max(1, round((parts_lists / roots) ** (1 / depth)))
+    return {'roots': roots, 'fanout': fanout, 'groups': 1, 'parts': parts}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_stub(catalog_name, shape, port, latency, error_rate):
+    command = [
+        sys.executable, os.path.join(ROOT, 'stub_api.py'), '--port', str(port), '--catalogs', catalog_name,
+        '--latency', str(latency), '--error_rate', str(error_rate), '--seed', '1',
+    ]
+    for key, value in shape.items():
+        command += [f'--{key}', str(value)]
+
+    process = subprocess.Popen(command, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(200):
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.1).close()
+            return process
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError('stub_api.py did not start')
+
+
+def request_latency(catalog_name):
+    """
+    Задержка отдельных попыток запроса по гистограмме request_seconds (src/catalog/metrics.py):
+    ожидание ограничителя и паузы между повторами в неё не входят.
+    p50/p99 - верхние границы корзин, mean и max - точные значения.
+    """
+    from src.catalog.metrics import metrics, Histogram
+
+    total = Histogram(metrics.latency_buckets)
+    for (name, labels), histogram in metrics.histograms.items():
+        if name == 'request_seconds' and dict(labels).get('catalog') == catalog_name:
+            total.merge(histogram.counts, histogram.sum, histogram.count, histogram.max)
+
+    if not total.count:
+        return {'attempts': 0, 'p50_ms': None, 'p99_ms': None, 'mean_ms': None, 'max_ms': None}
+
+    return {
+        'attempts': total.count,
+        'p50_ms': round(total.quantile(0.5) * 1000, 3),
+        'p99_ms': round(total.quantile(0.99) * 1000, 3),
+        'mean_ms': round(total.sum / total.count * 1000, 3),
+        'max_ms': round(total.max * 1000, 3),
+    }
+
+
+async def run_workers(items, handler, workers):
+    queue = asyncio.Queue()
+    for item in items:
+        queue.put_nowait(item)
+
+    async def worker():
+        while not queue.empty():
+            await handler(queue.get_nowait())
+
+    await asyncio.gather(*(worker() for _ in range(workers)))
+
+
+def rate(count, seconds):
+    return round(count / seconds, 1) if seconds else None
+
+
+async def bench_catalog(catalog_name, api_url, workers, validate_limit, db_rows):
+    from tqdm import tqdm
+    from database import (initialize_db, add_catalog, add_parts_list, add_detail, flush_db, close_db,
+                          fetch_parts_lists_batch, fetch_parts_batch, count_parts_by_category)
+    from src.catalog.catalog import create_catalog_instance
+    from src.catalog.category import create_category_instance
+    from src.catalog.part import create_part_instance
+    from src.catalog.traversal import Traversal
+
+    await initialize_db()
+    catalog = await create_catalog_instance(catalog_name=catalog_name)
+    catalog.api_url = api_url
+    # Кэш ответов исказил бы скорость запросов
+    catalog.cache.maxsize = 0
+    await add_catalog(name=catalog_name)
+    result = {}
+
+    try:
+        # Обход дерева
+        started = time.perf_counter()
+        roots = [await catalog.add_category(data=data) for data in (await catalog.fetch_tree()).get('data')]
+
+        async def on_parts_list(child, parent):
+            await add_parts_list(root_id=child.root_id, parts_list_id=child.id, name=child.name,
+                                 catalog_name=catalog_name)
+
+        traversal = Traversal(catalog, workers=workers, on_parts_list=on_parts_list)
+        stats = await traversal.run(roots=roots)
+        await flush_db()
+        seconds = time.perf_counter() - started
+        nodes = len(roots) + stats['categories'] + stats['parts_lists']
+        result['tree'] = {'nodes': nodes, 'seconds': round(seconds, 3), 'nodes_per_sec': rate(nodes, seconds)}
+
+        # Детали перечней
+        parts_lists = []
+        for root in roots:
+            after_id = -1
+            while rows := await fetch_parts_lists_batch(root.id, catalog_name, 1000, after_id=after_id):
+                parts_lists += [(root, row) for row in rows]
+                after_id = rows[-1][0]
+
+        progress = tqdm(disable=True)
+
+        async def fetch_parts(item):
+            root, (parts_list_id, name, root_id) = item
+            parts_list = await create_category_instance(catalog=catalog, category_id=parts_list_id, name=name,
+                                                        root_id=root_id)
+            await parts_list.fetch_parts(category=root, test_api=False, t=progress)
+
+        started = time.perf_counter()
+        await run_workers(parts_lists, fetch_parts, workers)
+        await flush_db()
+        seconds = time.perf_counter() - started
+        result['parts_lists'] = {
+            'parts_lists': len(parts_lists),
+            'parts': sum((await count_parts_by_category(catalog_name)).values()),
+            'seconds': round(seconds, 3),
+            'parts_lists_per_sec': rate(len(parts_lists), seconds),
+        }
+
+        # Проверка деталей (не более validate_limit)
+        parts = []
+        for root in roots:
+            after_id = -1
+            while len(parts) < validate_limit and (
+                    rows := await fetch_parts_batch(root.id, catalog_name, 5000, after_id=after_id)):
+                parts += [(root, row) for row in rows]
+                after_id = rows[-1][0]
+        parts = parts[:validate_limit]
+
+        async def validate(item):
+            root, (part_id, name, category_id) = item
+            part = await create_part_instance(catalog=catalog, category=root, part_id=part_id, name=name)
+            await part.validate(progress=None)
+
+        started = time.perf_counter()
+        await run_workers(parts, validate, workers)
+        seconds = time.perf_counter() - started
+        result['validate'] = {'parts': len(parts), 'seconds': round(seconds, 3), 'parts_per_sec': rate(len(parts), seconds)}
+
+        # Запись в базу без сети
+        started = time.perf_counter()
+        for detail_id in range(db_rows):
+            await add_detail(detail_id=-1 - detail_id, name='bench', category_id=roots[0].id, catalog_name=catalog_name)
+        await flush_db()
+        seconds = time.perf_counter() - started
+        result['db'] = {'rows': db_rows, 'seconds': round(seconds, 3), 'rows_per_sec': rate(db_rows, seconds)}
+
+        result['requests'] = {**request_latency(catalog_name), **catalog.retry_stats.as_dict()}
+        # Паузы между повторами (backoff, Retry-After) - отдельно от задержки попыток
+        result['retry_wait_seconds'] = round(catalog.retry_stats.backoff_time, 3)
+    finally:
+        await catalog.close()
+        await close_db()
+
+    return result
+
+
+def run_size(catalog_name, api_url, workers, validate_limit, db_rows):
+    """
+    Выполняется в отдельном процессе: рабочий каталог временный, чтобы база и логи не задевали рабочие.
+    """
+    os.chdir(tempfile.mkdtemp(prefix='partstest-bench-'))
+    result = asyncio.run(bench_catalog(catalog_name, api_url, workers, validate_limit, db_rows))
+    # ru_maxrss в Linux - килобайты
+    result['peak_rss_mb'] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Crawl, validation and database throughput benchmark')
+    parser.add_argument('--sizes', default='1k,100k', help=f'Comma separated: {",".join(SIZES)}')
+    parser.add_argument('--catalog', default='lemken', help='Catalog layout to emulate')
+    parser.add_argument('--workers', type=int, default=64, help='Concurrent requests per phase')
+    parser.add_argument('--validate_limit', type=int, default=20000, help='Max parts validated per size')
+    parser.add_argument('--db_rows', type=int, default=100000, help='Rows for the database write phase')
+    parser.add_argument('--latency', type=float, default=0.0, help='Stub response delay (seconds)')
+    parser.add_argument('--error_rate', type=float, default=0.0, help='Stub share of 429/5xx responses')
+    parser.add_argument('--output', help='JSON file (default benchmarks/results/<commit>.json)')
+    args = parser.parse_args()
+
+    commit = git_commit()
+    report = {
+        'commit': commit,
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'catalog': args.catalog,
+        'workers': args.workers,
+        'latency': args.latency,
+        'error_rate': args.error_rate,
+        'results': {},
+    }
+
+    for size in args.sizes.lower().split(','):
+        shape = tree_shape(args.catalog, SIZES[size])
+        port = free_port()
+        stub = start_stub(args.catalog, shape, port, args.latency, args.error_rate)
+        try:
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as executor:
+                result = executor.submit(
+                    run_size, args.catalog, f'http://127.0.0.1:{port}/api/v1', args.workers,
+                    args.validate_limit, args.db_rows,
+                ).result()
+        finally:
+            stub.terminate()
+            stub.wait()
+
+        result['shape'] = shape
+        report['results'][size] = result
+        print(size, json.dumps(result, ensure_ascii=False))
+
+    output = args.output or os.path.join(ROOT, 'benchmarks', 'results', f'{commit}.json')
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as file:
+        json.dump(report, file, indent=2, ensure_ascii=False)
+    print(f'Saved {output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+"""
+Неинтерактивный запуск обхода каталогов (cron, CI) без меню и pytest.
+Тяжёлые модули импортируются только при выполнении команды.
+
+Запуск:
+    python cli.py crawl --catalogs lemken,kubota --phase tree,parts,validate
+    python cli.py crawl --catalogs lemken --phase pipeline --api_url http://127.0.0.1:8081/api/v1
+    python cli.py allure --host auto
+    (--loop uvloop - цикл событий uvloop, если пакет установлен)
+
+Каталоги очищаются перед запуском с этапом roots (или pipeline), этапы без roots продолжают
+данные прошлого запуска. --fresh очищает каталоги всегда.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+PHASES = ('roots', 'tree', 'parts', 'validate', 'pipeline')
+
+
+def parse_phases(value):
+    phases = [phase for phase in value.split(',') if phase]
+    unknown = [phase for phase in phases if phase not in PHASES]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown phase {', '.join(unknown)}, choose from {', '.join(PHASES)}")
+    if 'pipeline' in phases and len(phases) > 1:
+        raise argparse.ArgumentTypeError('pipeline runs all phases and can not be combined with others')
+    return phases
+
+
+async def crawl_catalog(catalog_name, args):
+    """
+    Обход одного каталога выбранными этапами.
+    :return: Число ошибок обхода
+    """
+    from database import add_catalog, crawl_summary, fetch_categories, flush_db, validation_report
+    from src.catalog.catalog import create_catalog_instance
+    from src.catalog.sampling import create_sampler
+
+    catalog = await create_catalog_instance(catalog_name=catalog_name)
+    catalog.resume = args.resume
+    catalog.incremental = args.incremental
+    catalog.validation_shards = args.validation_shards
+    catalog.tree_workers = args.tree_workers
+    catalog.sampler = create_sampler(
+        fraction=args.sample,
+        fanout=args.sample_fanout,
+        seed=args.sample_seed,
+        method=args.sample_method,
+        time_budget=args.time_budget,
+    )
+    if args.api_url:
+        catalog.api_url = args.api_url.rstrip('/')
+
+    from src.catalog.cassette import Cassette
+    catalog.cassette = Cassette.from_env()
+    if catalog.cassette is not None:
+        await catalog.cassette.open()
+
+    await add_catalog(name=catalog_name)
+    started = time.monotonic()
+
+    try:
+        if args.phase == ['pipeline']:
+            from src.catalog.pipeline import Pipeline
+            crawler = Pipeline(catalog=catalog, test_api=args.test_api)
+            await crawler.run()
+        else:
+            from src.catalog.crawler import Crawler
+            crawler = Crawler(catalog=catalog, test_api=args.test_api)
+            await crawler.run(phases=args.phase)
+    finally:
+        await catalog.close()
+        if catalog.cassette is not None:
+            await catalog.cassette.close()
+
+    await flush_db()
+    print(f'{catalog}: {crawler} in {time.monotonic() - started:.0f}s ({catalog.retry_stats})')
+    summary = await crawl_summary(catalog_name=catalog_name)
+    print(f'Summary {catalog}: ' + ', '.join(f'{key} {value}' for key, value in summary.items()))
+    if catalog.sampler is not None:
+        print(f'Sample coverage {catalog}: {catalog.sampler}')
+    for entity, section, field, count in await validation_report(catalog_name=catalog_name):
+        print(f'Missing {catalog} {entity} {section}.{field}: {count}')
+    categories = await fetch_categories(catalog_name=catalog_name)
+    for category_id, entity, section, field, count in await validation_report(catalog_name=catalog_name,
+                                                                             by_category=True):
+        print(f'Missing {catalog}/{categories.get(category_id, category_id)} {entity} {section}.{field}: {count}')
+
+    return crawler.stats['errors']
+
+
+async def crawl(args):
+    from database import initialize_db, clear_db, close_db
+    from src.catalog.metrics import metrics
+
+    await initialize_db(clear=False)
+    # Этапы после roots продолжают данные прошлого запуска (--phase roots,tree, затем --phase parts,validate)
+    starts_over = 'roots' in args.phase or args.phase == ['pipeline']
+    if args.fresh or (starts_over and not args.resume and not args.incremental):
+        for catalog_name in args.catalogs:
+            await clear_db(catalog_name=catalog_name)
+
+    try:
+        errors = await asyncio.gather(*(crawl_catalog(catalog_name, args) for catalog_name in args.catalogs),
+                                      return_exceptions=True)
+    finally:
+        await close_db()
+
+    code = 0
+    for catalog_name, result in zip(args.catalogs, errors):
+        if isinstance(result, BaseException):
+            print(f'{catalog_name}: failed with {result!r}', file=sys.stderr)
+            code = 1
+        elif result:
+            code = 1
+
+    if args.metrics_dir and (metrics.counters or metrics.histograms):
+        metrics.write(directory=args.metrics_dir)
+
+    return code
+
+
+async def allure(args):
+    host = args.host
+    if host == 'auto':
+        from utility import get_ip_address
+        host = await get_ip_address()
+
+    process = await asyncio.create_subprocess_exec('allure', 'serve', '--host', host, '--port', str(args.port),
+                                                   args.alluredir)
+    return await process.wait()
+
+
+def run(main, loop='asyncio'):
+    """
+    Выполняет корутину в новом цикле событий.
+    :param loop: 'uvloop' - цикл uvloop, если пакет установлен, иначе стандартный
+    """
+    loop_factory = None
+    if loop == 'uvloop':
+        try:
+            import uvloop
+            loop_factory = uvloop.new_event_loop
+        except ImportError:
+            print('uvloop is not installed, using the asyncio event loop', file=sys.stderr)
+
+    return asyncio.run(main, loop_factory=loop_factory)
+
+
+def create_parser():
+    parser = argparse.ArgumentParser(description='Headless runner for catalog crawls')
+    parser.add_argument('--loop', choices=('asyncio', 'uvloop'), default=os.environ.get('PARTSTEST_LOOP', 'asyncio'),
+                        help='Event loop implementation')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    crawl_parser = commands.add_parser('crawl', help='Crawl catalogs without interactive menus')
+    crawl_parser.add_argument('--catalogs', required=True, type=lambda value: [name for name in value.split(',') if name],
+                              help='Example: lemken,kubota')
+    crawl_parser.add_argument('--phase', type=parse_phases, default=['roots', 'tree', 'parts', 'validate'],
+                              help=f"Comma separated phases: {', '.join(PHASES)} (default: roots,tree,parts,validate)")
+    crawl_parser.add_argument('--test_api', action='store_true', help='Only the first item of every list')
+    crawl_parser.add_argument('--resume', action='store_true', help='Continue an interrupted crawl')
+    crawl_parser.add_argument('--incremental', action='store_true', help='Only subtrees changed since the last crawl')
+    crawl_parser.add_argument('--fresh', action='store_true',
+                              help='Clear the catalogs before running even when the phases do not include roots')
+    crawl_parser.add_argument('--sample', type=float, help='Share of children of every node to crawl, e.g. 0.05')
+    crawl_parser.add_argument('--sample_fanout', type=int, help='At most N children of every node')
+    crawl_parser.add_argument('--sample_method', choices=('random', 'stratified'), default='random',
+                              help='random: seeded random children, stratified: one from each equal part of the list')
+    crawl_parser.add_argument('--sample_seed', type=int, default=0, help='Seed of the sampling selection')
+    crawl_parser.add_argument('--time_budget', type=float, help='Stop expanding and validating after N seconds')
+    crawl_parser.add_argument('--tree_workers', type=int,
+                              help='Concurrent tree traversal workers (default: the maximum limiter window)')
+    crawl_parser.add_argument('--validation_shards', type=int, default=0, help='Validation worker processes')
+    crawl_parser.add_argument('--api_url', default=os.environ.get('PARTSTEST_API_URL'), help='Base API url')
+    crawl_parser.add_argument('--metrics_dir', default='metrics', help='Directory for metrics files ("" to disable)')
+    crawl_parser.set_defaults(handler=crawl)
+
+    allure_parser = commands.add_parser('allure', help='Serve the Allure report')
+    allure_parser.add_argument('--host', default='127.0.0.1', help='Host to listen on, "auto" - address of this machine')
+    allure_parser.add_argument('--port', type=int, default=8080)
+    allure_parser.add_argument('--alluredir', default='allure_results')
+    allure_parser.set_defaults(handler=allure)
+
+    return parser
+
+
+def main(argv=None):
+    args = create_parser().parse_args(argv)
+    try:
+        return run(args.handler(args), loop=args.loop)
+    except KeyboardInterrupt:
+        return 130
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,177 +1,698 @@
+import asyncio
 import aiosqlite
 import os
+import time
+from contextlib import asynccontextmanager
+from itertools import groupby
+from operator import itemgetter
 
+from src.catalog.metrics import metrics
 
-async def initialize_db():
-    if os.path.exists('db.sqlite'):
-        await clear_db()
-    else:
-        async with aiosqlite.connect('db.sqlite', timeout=30) as db:
-            await db.execute(
-                '''
-                    CREATE TABLE IF NOT EXISTS catalogs (
-                        catalog_name TEXT PRIMARY KEY
-                    )
-                '''
-            )
-
-            await db.execute(
-                '''
-                    CREATE TABLE IF NOT EXISTS categories (
-                        category_id INTEGER,
-                        name TEXT,
-                        catalog_name TEXT,
-                        PRIMARY KEY (category_id, catalog_name),
-                        FOREIGN KEY (catalog_name) REFERENCES catalogs(catalog_name)
-                    )
-                '''
-            )
-
-            await db.execute(
-                '''
-                    CREATE TABLE IF NOT EXISTS parts_lists (
-                        parts_list_id INTEGER PRIMARY KEY,
-                        root_id INTEGER,
-                        name TEXT,
-                        catalog_name TEXT,
-                        FOREIGN KEY (root_id, catalog_name) REFERENCES categories(category_id, catalog_name)
-                    )
-                '''
-            )
-
-            await db.execute(
-                '''
-                    CREATE TABLE IF NOT EXISTS details (
-                        detail_id INTEGER PRIMARY KEY,
-                        category_id INTEGER,
-                        catalog_name TEXT,
-                        name TEXT,
-                        FOREIGN KEY (category_id, catalog_name) REFERENCES categories(category_id, catalog_name)
-                    )
-                '''
-            )
+# Отдельный файл базы задаётся для процессов параллельного запуска (runner.py)
+DB_PATH = os.environ.get('PARTSTEST_DB', 'db.sqlite')
 
-            await db.commit()
+PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA cache_size=-65536',
+    'PRAGMA mmap_size=268435456',
+    'PRAGMA temp_store=MEMORY',
+)
 
 
-async def add_catalog(name: str):
-    async with aiosqlite.connect('db.sqlite', timeout=30) as db:
+async def connect():
+    db = await aiosqlite.connect(DB_PATH, timeout=30)
+    for pragma in PRAGMAS:
+        await db.execute(pragma)
+    return db
+
+
+class ConnectionPool:
+    """
+    Пул соединений для чтения. Соединения открываются лениво (не больше size)
+    и настраиваются один раз при создании.
+    """
+
+    def __init__(self, size=4):
+        self.size = size
+        self._opened = 0
+        self._connections = []
+        self._idle = None
+        self._loop = None
+
+    async def _ensure_loop(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            await self.close()
+            self._loop = loop
+            self._idle = asyncio.Queue()
+
+    @asynccontextmanager
+    async def acquire(self):
+        await self._ensure_loop()
+
+        if self._idle.empty() and self._opened < self.size:
+            self._opened += 1
+            try:
+                db = await connect()
+            except BaseException:
+                self._opened -= 1
+                raise
+            self._connections.append(db)
+        else:
+            db = await self._idle.get()
+
+        try:
+            yield db
+        finally:
+            self._idle.put_nowait(db)
+
+    async def close(self):
+        connections, self._connections = self._connections, []
+        self._opened = 0
+        for db in connections:
+            try:
+                await db.close()
+            except Exception as error:
+                print(f"Database: connection not closed: {error}")
+        self._idle = None
+        self._loop = None
+
+
+class DatabaseWriter:
+    """
+    Единственная задача-писатель: забирает строки из ограниченной очереди и
+    записывает их пачками через executemany, одна транзакция на пачку.
+    Пачка сбрасывается при накоплении batch_size строк или раз в flush_interval секунд.
+    Заполненная очередь приостанавливает производителей.
+    """
+    statements = {
+        'catalogs': '''
+            INSERT OR IGNORE INTO catalogs (catalog_name)
+            VALUES (?)
+        ''',
+        'categories': '''
+            INSERT OR IGNORE INTO categories (category_id, name, catalog_name)
+            VALUES (?, ?, ?)
+        ''',
+        'parts_lists': '''
+            INSERT OR IGNORE INTO parts_lists (parts_list_id, name, root_id, catalog_name)
+            SELECT ?, ?, ?, ?
+            WHERE EXISTS (SELECT 1 FROM categories WHERE category_id = ? AND catalog_name = ?)
+        ''',
+        'details': '''
+            INSERT OR IGNORE INTO details (detail_id, name, category_id, catalog_name)
+            VALUES (?, ?, ?, ?)
+        ''',
+        'crawl_nodes': '''
+            INSERT OR IGNORE INTO crawl_nodes (catalog_name, category_id, name, root_id, depth)
+            VALUES (?, ?, ?, ?, ?)
+        ''',
+        'crawl_expanded': '''
+            UPDATE crawl_nodes SET expanded = 1 WHERE catalog_name = ? AND category_id = ?
+        ''',
+        'crawl_parts_lists': '''
+            INSERT OR IGNORE INTO crawl_parts_lists (catalog_name, parts_list_id)
+            VALUES (?, ?)
+        ''',
+        'crawl_details': '''
+            INSERT OR IGNORE INTO crawl_details (catalog_name, detail_id)
+            VALUES (?, ?)
+        ''',
+        'crawl_fingerprints': '''
+            INSERT OR REPLACE INTO crawl_fingerprints (catalog_name, category_id, fingerprint)
+            VALUES (?, ?, ?)
+        ''',
+        'crawl_reset_parts_lists': '''
+            DELETE FROM crawl_parts_lists WHERE catalog_name = ? AND parts_list_id = ?
+        ''',
+        'crawl_reset_details': '''
+            DELETE FROM crawl_details WHERE catalog_name = ? AND detail_id = ?
+        ''',
+        'validation_schema': '''
+            INSERT OR REPLACE INTO validation_schema (catalog_name, entity, section, bit, field)
+            VALUES (?, ?, ?, ?, ?)
+        ''',
+        'validation_reset': '''
+            DELETE FROM validation_results WHERE catalog_name = ? AND entity = ? AND entity_id = ?
+        ''',
+        'validation_results': '''
+            INSERT OR REPLACE INTO validation_results (catalog_name, entity, entity_id, category_id, section, mask)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''',
+    }
+
+    def __init__(self, batch_size=500, flush_interval=0.2, max_queue=10000):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self._queue = None
+        self._task = None
+        self._loop = None
+
+    def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._task = loop.create_task(self._run())
+
+    async def put(self, statement, params):
+        self._ensure_started()
+        await self._queue.put((statement, params))
+
+    async def flush(self):
+        if self._task is not None and not self._task.done() and self._loop is asyncio.get_running_loop():
+            await self._queue.join()
+
+    async def close(self):
+        if self._task is not None and not self._task.done() and self._loop is asyncio.get_running_loop():
+            await self._queue.put(None)
+            await self._task
+        self._task = None
+        self._queue = None
+
+    def _drain(self, batch):
+        while len(batch) < self.batch_size:
+            try:
+                item = self._queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return False
+            if item is None:
+                return True
+            batch.append(item)
+        return False
+
+    async def _run(self):
+        db = await connect()
+        try:
+            closing = False
+            while not closing:
+                item = await self._queue.get()
+                if item is None:
+                    self._queue.task_done()
+                    break
+
+                batch = [item]
+                closing = self._drain(batch)
+                if not closing and len(batch) < self.batch_size and self.flush_interval:
+                    await asyncio.sleep(self.flush_interval)
+                    closing = self._drain(batch)
+
+                try:
+                    await self._write(db, batch)
+                except Exception as error:
+                    print(f"Database: batch of {len(batch)} rows not written: {error}")
+                finally:
+                    for _ in range(len(batch) + closing):
+                        self._queue.task_done()
+        finally:
+            await db.close()
+
+    async def _write(self, db, batch):
+        # Инструкции выполняются в порядке поступления, executemany объединяет только
+        # идущие подряд строки одной инструкции (удаление не обгонит вставку, поставленную раньше)
+        for statement, group in groupby(batch, key=itemgetter(0)):
+            rows = [params for _, params in group]
+            started = time.perf_counter()
+            await db.executemany(self.statements[statement], rows)
+            metrics.observe('db_write_seconds', time.perf_counter() - started, buckets=metrics.db_buckets,
+                            statement=statement)
+            metrics.inc('db_rows_total', len(rows), statement=statement)
+
+        started = time.perf_counter()
+        await db.commit()
+        metrics.observe('db_write_seconds', time.perf_counter() - started, buckets=metrics.db_buckets,
+                        statement='commit')
+
+
+writer = DatabaseWriter()
+pool = ConnectionPool()
+
+
+async def initialize_db(clear=True, path=None):
+    path = path or DB_PATH
+    exists = os.path.exists(path)
+    async with aiosqlite.connect(path, timeout=30) as db:
         await db.execute(
             '''
-                INSERT OR IGNORE INTO catalogs (catalog_name)
-                VALUES(?)
-            ''', (name,)
+                CREATE TABLE IF NOT EXISTS catalogs (
+                    catalog_name TEXT PRIMARY KEY
+                )
+            '''
         )
-        await db.commit()
 
+        await db.execute(
+            '''
+                CREATE TABLE IF NOT EXISTS categories (
+                    category_id INTEGER,
+                    name TEXT,
+                    catalog_name TEXT,
+                    PRIMARY KEY (category_id, catalog_name),
+                    FOREIGN KEY (catalog_name) REFERENCES catalogs(catalog_name)
+                )
+            '''
+        )
+
+        await db.execute(
+            '''
+                CREATE TABLE IF NOT EXISTS parts_lists (
+                    parts_list_id INTEGER PRIMARY KEY,
+                    root_id INTEGER,
+                    name TEXT,
+                    catalog_name TEXT,
+                    FOREIGN KEY (root_id, catalog_name) REFERENCES categories(category_id, catalog_name)
+                )
+            '''
+        )
+
+        await db.execute(
+            '''
+                CREATE TABLE IF NOT EXISTS details (
+                    detail_id INTEGER PRIMARY KEY,
+                    category_id INTEGER,
+                    catalog_name TEXT,
+                    name TEXT,
+                    FOREIGN KEY (category_id, catalog_name) REFERENCES categories(category_id, catalog_name)
+                )
+            '''
+        )
+
+        # Контрольные точки обхода для возобновления прерванного запуска
+        await db.execute(
+            '''
+                CREATE TABLE IF NOT EXISTS crawl_nodes (
+                    catalog_name TEXT,
+                    category_id INTEGER,
+                    name TEXT,
+                    root_id INTEGER,
+                    depth INTEGER,
+                    expanded INTEGER DEFAULT 0,
+                    PRIMARY KEY (catalog_name, category_id)
+                )
+            '''
+        )
+
+        await db.execute(
+            '''
+                CREATE TABLE IF NOT EXISTS crawl_parts_lists (
+                    catalog_name TEXT,
+                    parts_list_id INTEGER,
+                    PRIMARY KEY (catalog_name, parts_list_id)
+                )
+            '''
+        )
 
-async def add_category(category_id: int, name: str, catalog_name: str):
-    async with aiosqlite.connect('db.sqlite', timeout=30) as db:
         await db.execute(
             '''
-                INSERT OR IGNORE INTO categories (category_id, name, catalog_name)
-                VALUES (?, ?, ?)
-            ''', (category_id, name, catalog_name)
+                CREATE TABLE IF NOT EXISTS crawl_details (
+                    catalog_name TEXT,
+                    detail_id INTEGER,
+                    PRIMARY KEY (catalog_name, detail_id)
+                )
+            '''
         )
+
+        # Отпечатки узлов: текущего обхода и последнего завершённого (не очищаются clear_db)
+        await db.execute(
+            '''
+                CREATE TABLE IF NOT EXISTS crawl_fingerprints (
+                    catalog_name TEXT,
+                    category_id INTEGER,
+                    fingerprint TEXT,
+                    PRIMARY KEY (catalog_name, category_id)
+                )
+            '''
+        )
+
+        await db.execute(
+            '''
+                CREATE TABLE IF NOT EXISTS fingerprints (
+                    catalog_name TEXT,
+                    category_id INTEGER,
+                    fingerprint TEXT,
+                    PRIMARY KEY (catalog_name, category_id)
+                )
+            '''
+        )
+
+        # Результаты проверки: маска отсутствующих полей, биты расшифровываются по validation_schema
+        await db.execute(
+            '''
+                CREATE TABLE IF NOT EXISTS validation_schema (
+                    catalog_name TEXT,
+                    entity TEXT,
+                    section TEXT,
+                    bit INTEGER,
+                    field TEXT,
+                    PRIMARY KEY (catalog_name, entity, section, bit)
+                )
+            '''
+        )
+
+        await db.execute(
+            '''
+                CREATE TABLE IF NOT EXISTS validation_results (
+                    catalog_name TEXT,
+                    entity TEXT,
+                    entity_id INTEGER,
+                    category_id INTEGER,
+                    section TEXT,
+                    mask INTEGER,
+                    PRIMARY KEY (catalog_name, entity, entity_id, section)
+                )
+            '''
+        )
+
+        await db.execute(
+            '''
+                CREATE INDEX IF NOT EXISTS idx_validation_results_category
+                ON validation_results (catalog_name, category_id)
+            '''
+        )
+
+        await db.execute(
+            '''
+                CREATE INDEX IF NOT EXISTS idx_parts_lists_root
+                ON parts_lists (catalog_name, root_id)
+            '''
+        )
+
+        await db.execute(
+            '''
+                CREATE INDEX IF NOT EXISTS idx_details_category
+                ON details (catalog_name, category_id)
+            '''
+        )
+
         await db.commit()
 
+    if exists and clear:
+        await clear_db(path=path)
+
+
+async def add_catalog(name: str):
+    await writer.put('catalogs', (name,))
+
+
+async def add_category(category_id: int, name: str, catalog_name: str):
+    await writer.put('categories', (category_id, name, catalog_name))
+
 
 async def add_parts_list(root_id: int, parts_list_id: int, name: str, catalog_name: str):
-    async with aiosqlite.connect('db.sqlite', timeout=30) as db:
+    # Перечень без корневой категории в каталоге не записывается
+    await writer.put('parts_lists', (parts_list_id, name, root_id, catalog_name, root_id, catalog_name))
+
+
+async def add_detail(detail_id: int, name: str, category_id: int, catalog_name: str):
+    await writer.put('details', (detail_id, name, category_id, catalog_name))
+
+
+async def flush_db():
+    await writer.flush()
+
+
+async def close_db():
+    await writer.close()
+    await pool.close()
+
+
+@metrics.timed('db_read_seconds', buckets=metrics.db_buckets)
+async def count_parts_lists_by_category(catalog_name: str):
+    async with pool.acquire() as db:
         async with db.execute(
-                '''
-                    SELECT * FROM categories WHERE category_id = ? AND catalog_name = ?
-                ''', (root_id, catalog_name)
+            "SELECT root_id, COUNT(*) FROM parts_lists WHERE catalog_name = ? GROUP BY root_id", (catalog_name,)
         ) as cursor:
-            category = await cursor.fetchone()
-
-        if category:
-            await db.execute(
-                '''
-                    INSERT OR IGNORE INTO parts_lists (parts_list_id, name, root_id, catalog_name)
-                    VALUES (?, ?, ?, ?)
-                ''', (parts_list_id, name, root_id, catalog_name)
-            )
-            await db.commit()
-        else:
-            print(f"Database: Catalog with name {catalog_name} Category with ID {root_id} not found.")
+            return dict(await cursor.fetchall())
 
 
-async def count_parts_list(category_id: int, catalog_name: str):
-    async with aiosqlite.connect('db.sqlite', timeout=30) as db:
+@metrics.timed('db_read_seconds', buckets=metrics.db_buckets)
+async def count_parts_by_category(catalog_name: str):
+    async with pool.acquire() as db:
         async with db.execute(
-            "SELECT COUNT(*) FROM parts_lists WHERE root_id = ? AND catalog_name = ?", (category_id, catalog_name)
+            "SELECT category_id, COUNT(*) FROM details WHERE catalog_name = ? GROUP BY category_id", (catalog_name,)
         ) as cursor:
-            row = await cursor.fetchone()
-            if row:
-                return row[0]
-    return 0
+            return dict(await cursor.fetchall())
 
 
-async def add_detail(detail_id: int, name: str, category_id: int, catalog_name: str):
-    async with aiosqlite.connect('db.sqlite', timeout=30) as db:
-        await db.execute(
+@metrics.timed('db_read_seconds', buckets=metrics.db_buckets)
+async def crawl_summary(catalog_name: str):
+    """
+    Итоги обхода каталога одним запросом: количество категорий, перечней, деталей
+    и записей, ссылающихся на отсутствующую категорию.
+    """
+    async with pool.acquire() as db:
+        async with db.execute(
             '''
-                INSERT OR IGNORE INTO details (detail_id, name, category_id, catalog_name)
-                VALUES (?, ?, ?, ?)
-            ''', (detail_id, name, category_id, catalog_name)
+                SELECT
+                    (SELECT COUNT(*) FROM categories WHERE catalog_name = :catalog),
+                    (SELECT COUNT(*) FROM parts_lists WHERE catalog_name = :catalog),
+                    (SELECT COUNT(*) FROM details WHERE catalog_name = :catalog),
+                    (SELECT COUNT(*) FROM parts_lists AS pl WHERE pl.catalog_name = :catalog AND NOT EXISTS (
+                        SELECT 1 FROM categories AS c WHERE c.category_id = pl.root_id AND c.catalog_name = :catalog)),
+                    (SELECT COUNT(*) FROM details AS d WHERE d.catalog_name = :catalog AND NOT EXISTS (
+                        SELECT 1 FROM categories AS c WHERE c.category_id = d.category_id AND c.catalog_name = :catalog))
+            ''', {'catalog': catalog_name}
+        ) as cursor:
+            categories, parts_lists, details, orphan_parts_lists, orphan_details = await cursor.fetchone()
+
+    return {
+        'categories': categories,
+        'parts_lists': parts_lists,
+        'details': details,
+        'orphan_parts_lists': orphan_parts_lists,
+        'orphan_details': orphan_details,
+    }
+
+
+@metrics.timed('db_read_seconds', buckets=metrics.db_buckets)
+async def fetch_parts_lists_batch(category_id, catalog_name, batch_size, after_id=-1, pending_only=False):
+    # Постраничная выборка по ключу: следующая страница начинается после after_id
+    query = (
+        "SELECT parts_list_id, name, root_id FROM parts_lists AS pl WHERE catalog_name = ? AND root_id = ? "
+        "AND parts_list_id > ? "
+    )
+    if pending_only:
+        query += (
+            "AND NOT EXISTS (SELECT 1 FROM crawl_parts_lists AS c "
+            "WHERE c.catalog_name = pl.catalog_name AND c.parts_list_id = pl.parts_list_id) "
         )
-        await db.commit()
+    query += "ORDER BY parts_list_id LIMIT ?"
+
+    async with pool.acquire() as db:
+        async with db.execute(query, (catalog_name, category_id, after_id, batch_size)) as cursor:
+            return await cursor.fetchall()
+
+
+@metrics.timed('db_read_seconds', buckets=metrics.db_buckets)
+async def fetch_parts_batch(category_id, catalog_name, batch_size, after_id=-1, pending_only=False):
+    query = (
+        "SELECT detail_id, name, category_id FROM details AS d WHERE catalog_name = ? AND category_id = ? "
+        "AND detail_id > ? "
+    )
+    if pending_only:
+        query += (
+            "AND NOT EXISTS (SELECT 1 FROM crawl_details AS c "
+            "WHERE c.catalog_name = d.catalog_name AND c.detail_id = d.detail_id) "
+        )
+    query += "ORDER BY detail_id LIMIT ?"
+
+    async with pool.acquire() as db:
+        async with db.execute(query, (catalog_name, category_id, after_id, batch_size)) as cursor:
+            return await cursor.fetchall()
 
 
-async def count_parts(category_id: int, catalog_name: str):
-    async with aiosqlite.connect('db.sqlite', timeout=30) as db:
+@metrics.timed('db_read_seconds', buckets=metrics.db_buckets)
+async def fetch_detail_ranges(catalog_name, shards, pending_only=False):
+    """
+    Делит детали каталога на shards диапазонов id примерно равного размера.
+    :return: Строки (номер, первый id, последний id, количество)
+    """
+    query = "SELECT detail_id, NTILE(?) OVER (ORDER BY detail_id) AS shard FROM details AS d WHERE catalog_name = ? "
+    if pending_only:
+        query += (
+            "AND NOT EXISTS (SELECT 1 FROM crawl_details AS c "
+            "WHERE c.catalog_name = d.catalog_name AND c.detail_id = d.detail_id) "
+        )
+
+    async with pool.acquire() as db:
         async with db.execute(
-            "SELECT COUNT(*) FROM details WHERE category_id = ? AND catalog_name = ?", (category_id, catalog_name)
+            f"SELECT shard, MIN(detail_id), MAX(detail_id), COUNT(*) FROM ({query}) GROUP BY shard ORDER BY shard",
+            (shards, catalog_name)
         ) as cursor:
-            row = await cursor.fetchone()
-            if row:
-                return row[0]
-    return 0
+            return await cursor.fetchall()
+
 
+@metrics.timed('db_read_seconds', buckets=metrics.db_buckets)
+async def fetch_parts_range(catalog_name, batch_size, after_id, last_id, pending_only=False):
+    query = (
+        "SELECT detail_id, name, category_id FROM details AS d WHERE catalog_name = ? "
+        "AND detail_id > ? AND detail_id <= ? "
+    )
+    if pending_only:
+        query += (
+            "AND NOT EXISTS (SELECT 1 FROM crawl_details AS c "
+            "WHERE c.catalog_name = d.catalog_name AND c.detail_id = d.detail_id) "
+        )
+    query += "ORDER BY detail_id LIMIT ?"
+
+    async with pool.acquire() as db:
+        async with db.execute(query, (catalog_name, after_id, last_id, batch_size)) as cursor:
+            return await cursor.fetchall()
 
-async def fetch_all_parts_lists(category_id: int, catalog_name: str):
-    async with aiosqlite.connect('db.sqlite', timeout=30) as db:
+
+@metrics.timed('db_read_seconds', buckets=metrics.db_buckets)
+async def fetch_categories(catalog_name: str):
+    async with pool.acquire() as db:
         async with db.execute(
-                "SELECT parts_list_id, name, root_id FROM parts_lists WHERE root_id = ? AND catalog_name = ?",
-                (category_id, catalog_name)
+            "SELECT category_id, name FROM categories WHERE catalog_name = ?", (catalog_name,)
         ) as cursor:
-            parts_lists = await cursor.fetchall()
-            return parts_lists
+            return dict(await cursor.fetchall())
+
+
+async def add_crawl_node(catalog_name: str, category_id: int, name: str, root_id, depth: int):
+    await writer.put('crawl_nodes', (catalog_name, category_id, name, root_id, depth))
+
+
+async def mark_node_expanded(catalog_name: str, category_id: int):
+    await writer.put('crawl_expanded', (catalog_name, category_id))
+
+
+async def mark_parts_list_fetched(catalog_name: str, parts_list_id: int):
+    await writer.put('crawl_parts_lists', (catalog_name, parts_list_id))
+
+
+async def mark_detail_validated(catalog_name: str, detail_id: int):
+    await writer.put('crawl_details', (catalog_name, detail_id))
+
+
+async def add_crawl_fingerprint(catalog_name: str, category_id: int, fingerprint: str):
+    await writer.put('crawl_fingerprints', (catalog_name, category_id, fingerprint))
+
+
+async def reset_parts_list_fetched(catalog_name: str, parts_list_id: int):
+    await writer.put('crawl_reset_parts_lists', (catalog_name, parts_list_id))
+
+
+async def reset_detail_validated(catalog_name: str, detail_id: int):
+    await writer.put('crawl_reset_details', (catalog_name, detail_id))
+    await writer.put('validation_reset', (catalog_name, 'part', detail_id))
 
 
-async def fetch_parts_lists_batch(category_id, catalog_name, batch_size, offset):
-    async with aiosqlite.connect('db.sqlite', timeout=30) as db:
+async def add_validation_schema(catalog_name: str, entity: str, section: str, fields):
+    """
+    :param fields: Поля в порядке битов маски
+    """
+    for bit, field in enumerate(fields):
+        await writer.put('validation_schema', (catalog_name, entity, section, bit, field))
+
+
+async def add_validation_result(catalog_name: str, entity: str, entity_id: int, category_id, section: str, mask: int):
+    await writer.put('validation_results', (catalog_name, entity, entity_id, category_id, section, mask))
+
+
+@metrics.timed('db_read_seconds', buckets=metrics.db_buckets)
+async def validation_report(catalog_name: str, by_category=False):
+    """
+    Количество записей с каждым отсутствующим полем.
+    :param by_category: Отдельно по каждой корневой категории
+    :return: Строки (entity, section, field, count) или (category_id, entity, section, field, count)
+    """
+    group = 'r.category_id, r.entity, r.section, s.field' if by_category else 'r.entity, r.section, s.field'
+    async with pool.acquire() as db:
         async with db.execute(
-            "SELECT parts_list_id, name, root_id FROM parts_lists WHERE root_id = ? AND catalog_name = ? LIMIT ? OFFSET ?",
-            (category_id, catalog_name, batch_size, offset)
+            f'''
+                SELECT {group}, COUNT(*) FROM validation_results AS r
+                JOIN validation_schema AS s
+                ON s.catalog_name = r.catalog_name AND s.entity = r.entity AND s.section = r.section
+                AND (r.mask >> s.bit) & 1
+                WHERE r.catalog_name = ?
+                GROUP BY {group}
+                ORDER BY COUNT(*) DESC
+            ''', (catalog_name,)
         ) as cursor:
             return await cursor.fetchall()
 
 
-async def fetch_parts(category_id: int, catalog_name: str):
-    async with aiosqlite.connect('db.sqlite', timeout=30) as db:
+async def reset_crawl_nodes(catalog_name: str):
+    await writer.flush()
+    async with pool.acquire() as db:
+        await db.execute("DELETE FROM crawl_nodes WHERE catalog_name = ?", (catalog_name,))
+        await db.execute("DELETE FROM crawl_fingerprints WHERE catalog_name = ?", (catalog_name,))
+        await db.commit()
+
+
+@metrics.timed('db_read_seconds', buckets=metrics.db_buckets)
+async def fetch_fingerprints(catalog_name: str):
+    async with pool.acquire() as db:
         async with db.execute(
-                "SELECT detail_id, name, category_id FROM details WHERE category_id = ? AND catalog_name = ?",
-                (category_id, catalog_name)
+            "SELECT category_id, fingerprint FROM fingerprints WHERE catalog_name = ?", (catalog_name,)
         ) as cursor:
-            parts = await cursor.fetchall()
-            return parts
+            return dict(await cursor.fetchall())
 
 
-async def fetch_parts_batch(category_id, catalog_name, batch_size, offset):
-    async with aiosqlite.connect('db.sqlite', timeout=30) as db:
+async def commit_fingerprints(catalog_name: str):
+    # Отпечатки текущего обхода становятся базой для следующего инкрементального запуска
+    await writer.flush()
+    async with pool.acquire() as db:
+        await db.execute(
+            '''
+                INSERT OR REPLACE INTO fingerprints (catalog_name, category_id, fingerprint)
+                SELECT catalog_name, category_id, fingerprint FROM crawl_fingerprints WHERE catalog_name = ?
+            ''', (catalog_name,)
+        )
+        await db.execute("DELETE FROM crawl_fingerprints WHERE catalog_name = ?", (catalog_name,))
+        await db.commit()
+
+
+@metrics.timed('db_read_seconds', buckets=metrics.db_buckets)
+async def count_crawl_nodes(catalog_name: str):
+    async with pool.acquire() as db:
+        async with db.execute("SELECT COUNT(*) FROM crawl_nodes WHERE catalog_name = ?", (catalog_name,)) as cursor:
+            row = await cursor.fetchone()
+            return row[0] if row else 0
+
+
+@metrics.timed('db_read_seconds', buckets=metrics.db_buckets)
+async def fetch_pending_nodes(catalog_name: str):
+    async with pool.acquire() as db:
         async with db.execute(
-                "SELECT detail_id, name, category_id FROM details WHERE category_id = ? AND catalog_name = ? LIMIT ? OFFSET ?",
-                (category_id, catalog_name, batch_size, offset)
+            "SELECT category_id, name, root_id, depth FROM crawl_nodes WHERE catalog_name = ? AND expanded = 0",
+            (catalog_name,)
         ) as cursor:
             return await cursor.fetchall()
 
 
-async def clear_db():
-    async with aiosqlite.connect('db.sqlite', timeout=30) as db:
-        await db.execute("DELETE FROM details;")
-        await db.execute("DELETE FROM parts_lists;")
-        await db.execute("DELETE FROM categories;")
-        await db.execute("DELETE FROM catalogs;")
+CLEARED_TABLES = (
+    'crawl_fingerprints', 'crawl_details', 'crawl_parts_lists', 'crawl_nodes',
+    'validation_results', 'validation_schema', 'details', 'parts_lists', 'categories', 'catalogs',
+)
+
+
+async def clear_db(catalog_name=None, path=None):
+    await writer.flush()
+    async with aiosqlite.connect(path or DB_PATH, timeout=30) as db:
+        for table in CLEARED_TABLES:
+            if catalog_name is None:
+                await db.execute(f"DELETE FROM {table};")
+            else:
+                await db.execute(f"DELETE FROM {table} WHERE catalog_name = ?;", (catalog_name,))
         await db.commit()
+
+
+async def merge_db(paths):
+    """
+    Переносит строки баз отдельных процессов в основную базу.
+    :param paths: Файлы баз процессов
+    """
+    await writer.flush()
+    tables = CLEARED_TABLES + ('fingerprints',)
+    async with aiosqlite.connect(DB_PATH, timeout=30) as db:
+        for path in paths:
+            if not os.path.exists(path):
+                continue
+            await db.execute("ATTACH DATABASE ? AS shard", (path,))
+            for table in tables:
+                await db.execute(f"INSERT OR REPLACE INTO main.{table} SELECT * FROM shard.{table}")
+            await db.commit()
+            await db.execute("DETACH DATABASE shard")
@@ -1,11 +1,15 @@
 import asyncio
+import json
+import sys
 import aiohttp
-import pytest
 from InquirerPy import inquirer
 from colorama import Fore, init
 from tqdm import tqdm
-from utility import update_spinner, get_ip_address
+from utility import update_spinner, get_ip_address, API_URL
 from database import initialize_db, clear_db
+from runner import run_parallel, split_option
+from src.catalog.cache import ResponseCache
+from src.catalog.cassette import Cassette
 
 # Инициализация colorama
 init(autoreset=True)
@@ -39,18 +43,43 @@ class Level:
 
 
 level = Level()
+brands_cache = ResponseCache(maxsize=1, ttl=600)
 
 
-async def fetch_brands(session):
-    url = 'http://api.catalog.detalum.ru/api/v1/brand'
+async def fetch_brands(session, cassette=None):
+    url = f'{API_URL}/brand'
 
-    async with session.get(url) as response:
-        if response.status == 200:
-            data = await response.json()
-            return {brand.get('label'): brand.get('slug') for brand in data.get('data', [])}
-        else:
-            print(Fore.RED + f'Bad request {url}')
-            return None
+    if cassette is not None and cassette.replay:
+        data = await cassette.load(url)
+    else:
+        async with session.get(url) as response:
+            if response.status != 200:
+                print(Fore.RED + f'Bad request {url}')
+                return None
+
+            body = await response.read()
+            if cassette is not None:
+                await cassette.put(url, body)
+            data = json.loads(body)
+
+    if not data:
+        print(Fore.RED + f'No brands in {url}')
+        return None
+
+    return {brand.get('label'): brand.get('slug') for brand in data.get('data', [])}
+
+
+async def load_brands():
+    cassette = Cassette.from_env()
+    if cassette is not None:
+        await cassette.open()
+
+    try:
+        async with aiohttp.ClientSession() as session:
+            return await fetch_brands(session, cassette=cassette)
+    finally:
+        if cassette is not None:
+            await cassette.close()
 
 
 async def start_app():
@@ -70,8 +99,8 @@ async def start_app():
             spinner_event = asyncio.Event()
             spinner_task = asyncio.create_task(update_spinner(spin=spinner, spin_text=spinner_text, spin_event=spinner_event))
             try:
-                async with aiohttp.ClientSession() as session:
-                    brands = await fetch_brands(session)
+                brands = await brands_cache.get_or_fetch('brands', load_brands)
+                brands = dict(brands) if brands else None
             finally:
                 spinner_event.set()
                 await spinner_task
@@ -81,8 +110,8 @@ async def start_app():
             if brands:
                 level + 1
                 brands['Тест API для всех каталогов'] = f"-s -v tests/test_catalog.py::TestCatalog::test_root_categories tests/test_catalog.py::TestCatalog::test_tree tests/test_catalog.py::TestCatalog::test_parts --catalogs={','.join(brands.values())} --test_api --alluredir allure_results"
-                ip_address = await get_ip_address()
-                brands['Запустить Allure'] = f"allure serve --host {ip_address} --port 8080 allure_results"
+                # Адрес машины определяется только при запуске Allure
+                brands['Запустить Allure'] = "allure serve --host {host} --port 8080 allure_results"
                 level.add_menu(brands)
                 await open_menu()
             else:
@@ -94,6 +123,21 @@ async def start_app():
         exit()
 
 
+async def run_pytest(command):
+    """
+    Запускает pytest отдельным процессом: у pytest-asyncio свой цикл событий, а Ctrl-C
+    прерывает тесты. При отмене (Ctrl-C в меню) процесс завершается.
+    :return: Код завершения pytest
+    """
+    process = await asyncio.create_subprocess_exec(sys.executable, '-m', 'pytest', *command)
+    try:
+        return await process.wait()
+    finally:
+        if process.returncode is None:
+            process.terminate()
+            await process.wait()
+
+
 async def open_menu(**kwargs):
     menu = level.get_menu()
 
@@ -117,16 +161,24 @@ async def open_menu(**kwargs):
 
     if choice.lower()[:4] == 'тест':
         try:
-            await clear_db()
             command = menu.get(choice).split()
-            pytest.main(command)
-        except SystemExit as error:
-            print(f"Pytest завершён с кодом: {error.code}")
+            if '--resume' not in command and '--incremental' not in command:
+                await clear_db()
+
+            catalogs, _ = split_option(command, '--catalogs')
+            if catalogs and ',' in catalogs:
+                # Несколько каталогов выполняются параллельно отдельными процессами
+                await run_parallel(command)
+            else:
+                code = await run_pytest(command)
+                print(f"Pytest завершён с кодом: {code}")
+        except asyncio.CancelledError:
+            print("Pytest был прерван. Возврат в меню.")
         finally:
             await open_menu()
     elif choice == 'Запустить Allure':
-        command = menu.get(choice)
         try:
+            command = menu.get(choice).format(host=await get_ip_address())
             process = await asyncio.create_subprocess_shell(command)
             await process.wait()
         except asyncio.CancelledError:
@@ -149,8 +201,12 @@ async def open_menu(**kwargs):
         brand_slug = menu.get(choice)
         catalog_menu = {
                 'Тест каталога': f'-s -v tests/test_catalog.py::TestCatalog::test_root_categories tests/test_catalog.py::TestCatalog::test_tree tests/test_catalog.py::TestCatalog::test_parts --catalogs={brand_slug} --alluredir allure_results',
+                'Тест каталога (продолжить)': f'-s -v tests/test_catalog.py::TestCatalog::test_root_categories tests/test_catalog.py::TestCatalog::test_tree tests/test_catalog.py::TestCatalog::test_parts --catalogs={brand_slug} --resume --alluredir allure_results',
+                'Тест каталога (изменения)': f'-s -v tests/test_catalog.py::TestCatalog::test_root_categories tests/test_catalog.py::TestCatalog::test_tree tests/test_catalog.py::TestCatalog::test_parts --catalogs={brand_slug} --incremental --alluredir allure_results',
+                'Тест каталога конвейером': f'-s -v tests/test_catalog.py::TestCatalog::test_pipeline --catalogs={brand_slug} --pipeline --alluredir allure_results',
                 'Тест дерева': f'-s -v tests/test_catalog.py::TestCatalog::test_root_categories tests/test_catalog.py::TestCatalog::test_tree --catalogs={brand_slug} --alluredir allure_results',
                 'Тест корневых категорий': f'-s -v tests/test_catalog.py::TestCatalog::test_root_categories --catalogs={brand_slug} --alluredir allure_results',
+                'Тест каталога (выборка 5%, 30 минут)': f'-s -v tests/test_catalog.py::TestCatalog::test_root_categories tests/test_catalog.py::TestCatalog::test_tree tests/test_catalog.py::TestCatalog::test_parts --catalogs={brand_slug} --sample 0.05 --sample_method stratified --time_budget 1800 --alluredir allure_results',
                 'Тест API': f'-s -v tests/test_catalog.py::TestCatalog::test_root_categories tests/test_catalog.py::TestCatalog::test_tree tests/test_catalog.py::TestCatalog::test_parts --catalogs={brand_slug} --test_api --alluredir allure_results',
         },
         level + 1
@@ -159,7 +215,7 @@ async def open_menu(**kwargs):
 
 
 async def main():
-    await initialize_db()
+    await initialize_db(clear=False)
     await start_app()
 
 if __name__ == '__main__':
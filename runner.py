@@ -0,0 +1,128 @@
+"""
+Параллельный запуск тестов каталогов: каждый каталог - отдельный процесс pytest со своим
+циклом событий и своей базой (PARTSTEST_DB), поэтому общее время близко к времени самого
+медленного каталога, а не к сумме. По завершении базы и результаты Allure объединяются.
+
+Запуск:
+    python runner.py -s -v tests/test_catalog.py::TestCatalog::test_parts --catalogs=lemken,kubota --alluredir allure_results
+    (--processes N - число одновременных процессов, по умолчанию число ядер)
+"""
+import asyncio
+import os
+import shutil
+import sys
+import time
+
+SHARDS_DIR = 'shards'
+
+
+def split_option(args, name):
+    """
+    Извлекает значение опции (--name=value или --name value) из аргументов pytest.
+    :return: (значение или None, аргументы без опции)
+    """
+    value = None
+    rest = []
+    args = iter(args)
+    for arg in args:
+        if arg == name:
+            value = next(args, None)
+        elif arg.startswith(f'{name}='):
+            value = arg.split('=', 1)[1]
+        else:
+            rest.append(arg)
+    return value, rest
+
+
+def shard_db_path(catalog):
+    return os.path.join(SHARDS_DIR, f'{catalog}.sqlite')
+
+
+async def run_catalog(catalog, args, alluredir, semaphore):
+    """
+    Запускает pytest для одного каталога, вывод процесса пишется в logs/<catalog>/pytest.log.
+    :return: Код завершения pytest
+    """
+    command = [sys.executable, '-m', 'pytest', *args, f'--catalogs={catalog}',
+               '--metrics_dir', os.path.join('metrics', catalog)]
+    if alluredir:
+        command += ['--alluredir', os.path.join(alluredir, catalog)]
+
+    env = dict(os.environ, PARTSTEST_DB=shard_db_path(catalog))
+    logs_dir = os.path.join('logs', catalog)
+    if not os.path.exists(logs_dir):
+        os.makedirs(logs_dir)
+
+    async with semaphore:
+        started = time.monotonic()
+        print(f'{catalog}: started')
+        with open(os.path.join(logs_dir, 'pytest.log'), 'w') as output:
+            process = await asyncio.create_subprocess_exec(*command, env=env, stdout=output, stderr=output)
+            try:
+                code = await process.wait()
+            finally:
+                if process.returncode is None:
+                    process.terminate()
+                    await process.wait()
+        print(f'{catalog}: {"passed" if code == 0 else f"failed ({code})"} in {time.monotonic() - started:.0f}s')
+    return code
+
+
+def merge_allure(alluredir, catalogs):
+    """
+    Файлы результатов Allure имеют уникальные имена, поэтому каталоги процессов просто сливаются.
+    """
+    for catalog in catalogs:
+        shard_dir = os.path.join(alluredir, catalog)
+        if not os.path.isdir(shard_dir):
+            continue
+        for name in os.listdir(shard_dir):
+            shutil.move(os.path.join(shard_dir, name), os.path.join(alluredir, name))
+        os.rmdir(shard_dir)
+
+
+async def run_parallel(args, processes=None):
+    """
+    Выполняет команду pytest с --catalogs=a,b,c как отдельные процессы по каталогам.
+    :param args: Аргументы pytest (как для pytest.main)
+    :param processes: Число одновременных процессов (по умолчанию - число ядер)
+    :return: {каталог: код завершения}
+    """
+    from database import initialize_db, merge_db, clear_db
+
+    catalogs, args = split_option(args, '--catalogs')
+    alluredir, args = split_option(args, '--alluredir')
+    catalogs = [catalog for catalog in (catalogs or '').split(',') if catalog]
+    # Продолжение и инкрементальный обход используют базы процессов с прошлого запуска
+    keep = '--resume' in args or '--incremental' in args
+
+    if not os.path.exists(SHARDS_DIR):
+        os.makedirs(SHARDS_DIR)
+    for catalog in catalogs:
+        await initialize_db(clear=not keep, path=shard_db_path(catalog))
+
+    semaphore = asyncio.Semaphore(processes or os.cpu_count() or 1)
+    codes = await asyncio.gather(*(run_catalog(catalog, args, alluredir, semaphore) for catalog in catalogs))
+
+    # Строки прошлого запуска, которых нет в новых базах процессов, не должны пережить слияние
+    if not keep:
+        for catalog in catalogs:
+            await clear_db(catalog_name=catalog)
+    await merge_db([shard_db_path(catalog) for catalog in catalogs])
+    if alluredir:
+        merge_allure(alluredir, catalogs)
+
+    return dict(zip(catalogs, codes))
+
+
+async def main():
+    from database import initialize_db
+
+    await initialize_db(clear=False)
+    processes, args = split_option(sys.argv[1:], '--processes')
+    results = await run_parallel(args, processes=int(processes) if processes else None)
+    sys.exit(max(results.values(), default=0))
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
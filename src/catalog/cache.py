@@ -0,0 +1,87 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+
+class ResponseCache:
+    """
+    LRU-кэш ответов с необязательным TTL. Одновременные запросы одного ключа
+    объединяются в одну задачу, пустые ответы (None) не кэшируются.
+    """
+
+    def __init__(self, maxsize=2048, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._data = OrderedDict()
+        self._in_flight = dict()
+
+    def get(self, key):
+        item = self._data.get(key)
+        if item is None:
+            return None
+
+        value, expires = item
+        if expires is not None and expires < time.monotonic():
+            del self._data[key]
+            return None
+
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        self._data[key] = (value, expires)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    async def get_or_fetch(self, key, fetch):
+        """
+        Возвращает значение из кэша или выполняет fetch(), разделяя результат
+        между всеми одновременно ожидающими его корутинами.
+        :param key: Ключ (URL)
+        :param fetch: Функция без аргументов, возвращающая корутину
+        """
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            task = asyncio.ensure_future(fetch())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+
+        return await asyncio.shield(task)
+
+    def _finish(self, key, task):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        if not task.cancelled() and task.exception() is None and task.result() is not None:
+            self.set(key, task.result())
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self):
+        return {
+            'size': len(self._data),
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+        }
+
+    def __len__(self):
+        return len(self._data)
+
+    def __str__(self):
+        return f"cache hits {self.hits} misses {self.misses} coalesced {self.coalesced}"
@@ -0,0 +1,135 @@
+import asyncio
+import hashlib
+import json
+import os
+import zlib
+
+import aiosqlite
+from yarl import URL
+
+
+class Cassette:
+    """
+    Архив ответов API для воспроизводимых запусков без сети.
+    Тела ответов хранятся сжатыми и адресуются по sha256 (одинаковые тела хранятся один раз),
+    индекс путь запроса -> хэш позволяет находить ответ без просмотра архива.
+    mode='record' - ответы сети записываются, mode='replay' - ответы берутся только из архива.
+    Перед использованием архив открывается через open().
+    """
+    modes = ('record', 'replay')
+
+    def __init__(self, path, mode='replay', latency=0.0, commit_every=500):
+        if mode not in self.modes:
+            raise ValueError(f"Unknown cassette mode {mode}")
+
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        self.commit_every = commit_every
+        self.hits = 0
+        self.misses = 0
+        self.recorded = 0
+        self._db = None
+        self._uncommitted = 0
+
+    @classmethod
+    def from_env(cls):
+        path = os.environ.get('PARTSTEST_CASSETTE')
+        if not path:
+            return None
+        return cls(
+            path=path,
+            mode=os.environ.get('PARTSTEST_CASSETTE_MODE', 'replay'),
+            latency=float(os.environ.get('PARTSTEST_REPLAY_LATENCY', 0)),
+        )
+
+    @property
+    def replay(self):
+        return self.mode == 'replay'
+
+    @staticmethod
+    def key(url):
+        # Ключ не зависит от хоста, чтобы архив подходил для любого api_url
+        return URL(url).path_qs
+
+    async def open(self):
+        if self._db is not None:
+            return self
+
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self._db = await aiosqlite.connect(self.path, timeout=30)
+        await self._db.execute('PRAGMA journal_mode=WAL')
+        await self._db.execute(
+            '''
+                CREATE TABLE IF NOT EXISTS blobs (
+                    hash TEXT PRIMARY KEY,
+                    body BLOB
+                )
+            '''
+        )
+        await self._db.execute(
+            '''
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    hash TEXT
+                )
+            '''
+        )
+        await self._db.commit()
+        return self
+
+    async def close(self):
+        if self._db is not None:
+            await self._db.commit()
+            await self._db.close()
+        self._db = None
+
+    async def get(self, url):
+        """
+        Возвращает тело ответа (bytes) из архива или None.
+        """
+        async with self._db.execute(
+            '''
+                SELECT blobs.body FROM responses JOIN blobs ON blobs.hash = responses.hash
+                WHERE responses.key = ?
+            ''', (self.key(url),)
+        ) as cursor:
+            row = await cursor.fetchone()
+
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return zlib.decompress(row[0])
+
+    async def put(self, url, body):
+        digest = hashlib.sha256(body).hexdigest()
+        await self._db.execute(
+            "INSERT OR IGNORE INTO blobs (hash, body) VALUES (?, ?)", (digest, zlib.compress(body, 6))
+        )
+        await self._db.execute(
+            "INSERT OR REPLACE INTO responses (key, hash) VALUES (?, ?)", (self.key(url), digest)
+        )
+        self.recorded += 1
+        self._uncommitted += 1
+
+        if self._uncommitted >= self.commit_every:
+            await self._db.commit()
+            self._uncommitted = 0
+
+    async def load(self, url):
+        """
+        Ответ для режима воспроизведения: JSON из архива с имитацией задержки сети.
+        """
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        body = await self.get(url)
+        return json.loads(body) if body is not None else None
+
+    def __str__(self):
+        return f"cassette {self.mode} hits {self.hits} misses {self.misses} recorded {self.recorded}"
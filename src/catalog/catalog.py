@@ -1,24 +1,135 @@
 import aiohttp
+import json
 import os
-import logging
 from datetime import datetime
 from abc import ABC, abstractmethod
 from src.catalog.category import create_category_instance
+from src.catalog.cache import ResponseCache
+from src.catalog.limiter import AdaptiveLimiter
+from src.catalog.logger import setup_queue_logger, stop_queue_logger
+from src.catalog.metrics import metrics
+from src.catalog.retry import RetryPolicy, RetryStats
 import asyncio
-from database import add_category as db_add_category
+from database import add_category as db_add_category, add_validation_schema, add_validation_result
+from utility import API_URL
 
 
 class Catalog(ABC):
-    api_url = 'http://api.catalog.detalum.ru/api/v1'
+    api_url = API_URL
     name_label_category = 'name'
+    depth = 2
+    part_list = False
 
-    def __init__(self, name):
+    # Настройки пула соединений общей сессии
+    connection_limit = 200
+    connection_limit_per_host = 100
+    dns_cache_ttl = 300
+    keepalive_timeout = 30
+
+    # Размер и время жизни (в секундах, None - без ограничения) кэша ответов
+    cache_size = 2048
+    cache_ttl = None
+
+    def __init__(self, name, log_suffix=''):
         self.name = name
+        self.log_suffix = log_suffix
         self.categories = dict()
         self.current_url = None
+        self.resume = False
+        self.incremental = False
+        self.validation_shards = 0
+        # Число обработчиков обхода дерева, по умолчанию - наибольшее окно ограничителя
+        self.tree_workers = None
+        # Если задан, результаты проверки передаются ему вместо записи в базу (процессы-обработчики)
+        self.validation_sink = None
+        # Выборочный обход (Sampler), None - полный обход
+        self.sampler = None
+        self.cassette = None
         self.validation_fields = set()
         self.validation_image_fields = set()
+        self._validation_schemas = set()
+        self._log_listener = None
         self.logger = self.__setup_logger()
+        self._session = None
+        self._session_loop = None
+        # Сверх limit_per_host запросы ждали бы соединения внутри aiohttp и искажали задержку
+        self.limiter = AdaptiveLimiter(max_limit=min(self.connection_limit, self.connection_limit_per_host))
+        self.retry_policy = RetryPolicy()
+        self.retry_stats = RetryStats()
+        self.cache = ResponseCache(maxsize=self.cache_size, ttl=self.cache_ttl)
+
+    async def get_session(self):
+        """
+        Возвращает общую для каталога сессию, создавая её при первом обращении.
+        Соединения переиспользуются всеми fetch_* запросами каталога.
+        """
+        loop = asyncio.get_running_loop()
+        # Сессия привязана к циклу событий, в котором создана
+        if self._session is not None and (self._session.closed or self._session_loop is not loop):
+            await self._close_session()
+        # Пока закрывалась прежняя сессия, новую мог создать другой запрос
+        if self._session is None:
+            connector = aiohttp.TCPConnector(
+                limit=self.connection_limit,
+                limit_per_host=self.connection_limit_per_host,
+                ttl_dns_cache=self.dns_cache_ttl,
+                keepalive_timeout=self.keepalive_timeout,
+            )
+            self._session = aiohttp.ClientSession(connector=connector)
+            self._session_loop = loop
+        return self._session
+
+    async def _close_session(self):
+        """
+        Закрывает сессию и её соединения. Соединения сессии из другого (например, уже закрытого)
+        цикла событий закрыть штатно может не получиться, тогда сессия отсоединяется от них.
+        """
+        session, self._session, self._session_loop = self._session, None, None
+        if session is None or session.closed:
+            return
+        try:
+            await session.close()
+        except RuntimeError as error:
+            self.logger.debug(f'{self.name} сессия прежнего цикла событий закрыта с ошибкой: {error}')
+            session.detach()
+
+    async def close(self):
+        await self._close_session()
+        self.close_logger()
+
+    def close_logger(self):
+        """
+        Дописывает очередь логов и итоги повторяющихся предупреждений.
+        """
+        if self._log_listener is not None:
+            stop_queue_logger(self._log_listener)
+            self._log_listener = None
+
+    async def record_validation(self, entity, entity_id, category_id, section, schema, mask):
+        """
+        Записывает результат проверки в validation_results: маску отсутствующих полей раздела.
+        Порядок битов схемы записывается в validation_schema при первом обращении.
+        :param entity: 'category' или 'part'
+        :param section: 'fields', 'imageFields' или 'category'
+        :param schema: Скомпилированная схема раздела (Schema)
+        :param mask: Маска отсутствующих полей
+        """
+        if self.validation_sink is not None:
+            self.validation_sink((entity, entity_id, category_id, section, mask))
+            return
+
+        if (entity, section) not in self._validation_schemas:
+            self._validation_schemas.add((entity, section))
+            await add_validation_schema(catalog_name=self.name, entity=entity, section=section, fields=schema.fields)
+
+        await add_validation_result(
+            catalog_name=self.name,
+            entity=entity,
+            entity_id=entity_id,
+            category_id=category_id,
+            section=section,
+            mask=mask,
+        )
 
     async def add_category(self, data):
         category_id = data.get('id')
@@ -35,72 +146,128 @@ class Catalog(ABC):
         if not os.path.exists(logs_dir):
             os.makedirs(logs_dir)
 
-        log_file = os.path.join(logs_dir, f"{self.name}_{datetime.now().strftime('%Y-%m-%d')}.log")
+        # Процессы-обработчики пишут в свои файлы (log_suffix), не удаляя основной лог
+        log_file = os.path.join(logs_dir, f"{self.name}_{datetime.now().strftime('%Y-%m-%d')}{self.log_suffix}.log")
 
         if os.path.exists(log_file):
             os.remove(log_file)
 
-        logger = logging.getLogger(self.name)
-        logger.setLevel(logging.WARNING)
-
-        file_handler = logging.FileHandler(log_file)
-        file_handler.setLevel(logging.WARNING)
-
-        formatter = logging.Formatter('%(asctime)s [%(levelname)s] %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
-        file_handler.setFormatter(formatter)
-
-        logger.addHandler(file_handler)
+        logger, self._log_listener = setup_queue_logger(name=f'{self.name}{self.log_suffix}', log_file=log_file)
         return logger
 
-    async def _make_request(self, url, retries=10, delay=2, timeout=60):
+    async def _make_request(self, url, policy=None, endpoint='other'):
         """
-        Выполняет асинхронный запрос с повторными попытками в случае таймаута.
+        Выполняет асинхронный запрос с повторными попытками по политике повторов.
         :param url: URL для запроса
-        :param retries: Количество попыток
-        :param delay: Задержка между попытками (в секундах)
-        :param timeout: Время ожидания ответа от сервера
+        :param policy: Политика повторов (по умолчанию политика каталога)
+        :param endpoint: Тип запроса для метрик: tree, category, parts, part
         :return: Ответ от сервера или None
         """
+        if self.cassette is not None and self.cassette.replay:
+            data = await self.cassette.load(url)
+            if data is None:
+                self.logger.warning(f"{self.name} {url} нет в архиве {self.cassette.path}")
+            return data
+
+        policy = policy or self.retry_policy
+        session = await self.get_session()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + policy.deadline
+        self.retry_stats.requests += 1
         attempt = 1
-        async with aiohttp.ClientSession() as session:
-            while attempt <= retries:
-                try:
-                    async with session.get(url, timeout=timeout) as response:
-                        response.raise_for_status()
-                        return await response.json()
-                except (aiohttp.ClientError, asyncio.TimeoutError) as error:
-                    self.logger.warning(f"{self.name} {url} Ошибка при попытке {attempt}/{retries}: {error}")
-
-                    if attempt == retries:
-                        self.logger.error(f"{self.name} все попытки исчерпаны. Запрос {url} не выполнен.")
-                finally:
-                    if attempt < retries:
-                        await asyncio.sleep(delay)
-                    attempt += 1
-        return None
+
+        while True:
+            retry_after = None
+            overloaded = False
+            status = 'error'
+
+            await self.limiter.acquire()
+            started = loop.time()
+            timeout = aiohttp.ClientTimeout(total=max(0.1, min(policy.timeout, deadline - started)))
+            try:
+                async with session.get(url, timeout=timeout) as response:
+                    status = response.status
+                    if response.status >= 400:
+                        overloaded = response.status == 429 or response.status >= 500
+
+                        if not policy.is_retryable(response.status):
+                            self.logger.warning(f"{self.name} {url} Ошибка {response.status}, запрос не повторяется")
+                            self.retry_stats.failed += 1
+                            metrics.inc('failed_requests_total', catalog=self.name, endpoint=endpoint)
+                            return None
+
+                        retry_after = policy.parse_retry_after(response.headers.get('Retry-After'))
+                    response.raise_for_status()
+                    body = await response.read()
+                    metrics.inc('response_bytes_total', len(body), catalog=self.name, endpoint=endpoint)
+
+                    # Тело, не являющееся JSON (например, страница техработ), повторяется как ошибка
+                    # и не записывается в архив
+                    data = json.loads(body)
+
+                    if self.cassette is not None:
+                        await self.cassette.put(url, body)
+
+                    return data
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as error:
+                overloaded = overloaded or isinstance(error, asyncio.TimeoutError)
+                if isinstance(error, asyncio.TimeoutError):
+                    status = 'timeout'
+                elif isinstance(error, ValueError):
+                    status = 'invalid'
+                self.logger.warning(
+                    f"{self.name} {url} Ошибка при попытке {attempt}/{policy.retries}: {error}",
+                    extra={'coalesce': f"{self.name} {endpoint}: ошибка {getattr(error, 'status', type(error).__name__)} при попытке"},
+                )
+            finally:
+                latency = loop.time() - started
+                self.limiter.release(latency=latency, overloaded=overloaded)
+                metrics.inc('requests_total', catalog=self.name, endpoint=endpoint, status=status)
+                metrics.observe('request_seconds', latency, catalog=self.name, endpoint=endpoint)
+
+            delay = policy.backoff(attempt, retry_after)
+
+            if attempt >= policy.retries:
+                self.logger.error(f"{self.name} все попытки исчерпаны. Запрос {url} не выполнен.")
+                self.retry_stats.failed += 1
+                metrics.inc('failed_requests_total', catalog=self.name, endpoint=endpoint)
+                return None
+
+            if loop.time() + delay >= deadline:
+                self.logger.error(f"{self.name} истёк бюджет времени {policy.deadline}с. Запрос {url} не выполнен.")
+                self.retry_stats.failed += 1
+                self.retry_stats.deadline_exceeded += 1
+                metrics.inc('failed_requests_total', catalog=self.name, endpoint=endpoint)
+                return None
+
+            self.retry_stats.retries += 1
+            metrics.inc('retries_total', catalog=self.name, endpoint=endpoint)
+            self.retry_stats.backoff_time += delay
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def _fetch(self, url, endpoint='other'):
+        self.current_url = url
+        return await self.cache.get_or_fetch(url, lambda: self._make_request(url=url, endpoint=endpoint))
 
     async def fetch_tree(self):
         url = f"{self.api_url}/{self.name}/catalog/tree"
-        self.current_url = url
-        resp = await self._make_request(url=url)
+        resp = await self._fetch(url=url, endpoint='tree')
         return resp
 
     async def fetch_category(self, category_id):
         url = f"{self.api_url}/{self.name}/catalog/{category_id}"
-        self.current_url = url
-        resp = await self._make_request(url=url)
+        resp = await self._fetch(url=url, endpoint='category')
         return resp
 
     async def fetch_parts(self, part_list_id):
         url = f"{self.api_url}/{self.name}/catalog/{part_list_id}/parts"
-        self.current_url = url
-        resp = await self._make_request(url=url)
+        resp = await self._fetch(url=url, endpoint='parts')
         return resp
 
     async def fetch_part(self, part_id):
         url = f"{self.api_url}/{self.name}/part/{part_id}"
-        self.current_url = url
-        resp = await self._make_request(url=url)
+        resp = await self._fetch(url=url, endpoint='part')
         return resp
 
     def __str__(self):
@@ -111,75 +278,51 @@ class Catalog(ABC):
 
 
 class LemkenCatalog(Catalog):
-
-    def __init__(self, name):
-        super(LemkenCatalog, self).__init__(name)
-        self.depth = 2
-        self.part_list = False
+    depth = 2
+    part_list = False
 
 
 class KubotaCatalog(Catalog):
-
-    def __init__(self, name):
-        super(KubotaCatalog, self).__init__(name)
-        self.depth = 2
-        self.part_list = False
+    depth = 2
+    part_list = False
 
 
 class GrimmeCatalog(Catalog):
-
-    def __init__(self, name):
-        super(GrimmeCatalog, self).__init__(name)
-        self.name_label_category = 'label'
-        self.depth = 4
-        self.part_list = False
+    name_label_category = 'label'
+    depth = 4
+    part_list = False
 
 
 class ClaasCatalog(Catalog):
-
-    def __init__(self, name):
-        super(ClaasCatalog, self).__init__(name)
-        self.depth = 3
-        self.part_list = False
+    depth = 3
+    part_list = False
 
 
 class KroneCatalog(Catalog):
-
-    def __init__(self, name):
-        super(KroneCatalog, self).__init__(name)
-        self.depth = 3
-        self.part_list = True
+    depth = 3
+    part_list = True
 
 
 class KvernelandCatalog(Catalog):
-
-    def __init__(self, name):
-        super(KvernelandCatalog, self).__init__(name)
-        self.depth = 2
-        self.part_list = False
+    depth = 2
+    part_list = False
 
 
 class JdeereCatalog(Catalog):
-
-    def __init__(self, name):
-        super(JdeereCatalog, self).__init__(name)
-        self.depth = 3
-        self.part_list = True
+    depth = 3
+    part_list = True
 
 
 class RopaCatalog(Catalog):
-
-    def __init__(self, name):
-        super(RopaCatalog, self).__init__(name)
-        self.depth = 2
-        self.part_list = False
+    depth = 2
+    part_list = False
 
 
-async def create_catalog_instance(catalog_name):
+async def create_catalog_instance(catalog_name, log_suffix=''):
     cls = globals().get(f"{catalog_name.capitalize()}Catalog")
     if cls is None:
         raise ValueError(f"Class {catalog_name.capitalize()}Catalog is not defined.")
-    return cls(name=catalog_name)
+    return cls(name=catalog_name, log_suffix=log_suffix)
 
 
 if __name__ == '__main__':
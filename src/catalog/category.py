@@ -1,15 +1,49 @@
 import asyncio
+import hashlib
 import time
 from abc import ABC, abstractmethod
 from random import randint
 
 from tqdm import tqdm
-from database import add_detail as db_add_detail
+from src.catalog.schema import compile_schemas
+from database import add_detail as db_add_detail, reset_detail_validated as db_reset_detail_validated
 from tests.conftest import catalog
 
 
+def fingerprint(data):
+    """
+    Отпечаток узла: id и updated_at всех записей ответа и их дочерних элементов.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+
+    for item in data or []:
+        if not isinstance(item, dict):
+            continue
+        digest.update(f"{item.get('id')}:{item.get('updated_at')};".encode())
+
+        for child in item.get('children') or []:
+            if isinstance(child, dict):
+                digest.update(f"{child.get('id')}:{child.get('updated_at')},".encode())
+
+    return digest.hexdigest()
+
+
 class Category(ABC):
+    # Узлов обхода могут быть миллионы: без __dict__ у экземпляров
+    __slots__ = ('catalog', 'root_id', 'id', 'name', 'loaded', 'fingerprint')
     name_label_part = 'name'
+    # Обязательные поля задаются на уровне класса и компилируются в схемы при объявлении подкласса
+    validation_fields = frozenset()
+    validation_image_fields = frozenset()
+    schema_sections = {
+        'fields': 'validation_fields',
+        'imageFields': 'validation_image_fields',
+    }
+    schemas = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.schemas = compile_schemas(cls, cls.schema_sections)
 
     def __init__(self, *args, **kwargs):
         self.catalog = kwargs.get('catalog')
@@ -17,8 +51,8 @@ class Category(ABC):
             self.root_id = kwargs.get('root_id')
         self.id = kwargs.get('category_id')
         self.name = kwargs.get('name')
-        self.validation_fields = set()
-        self.validation_image_fields = set()
+        self.loaded = False
+        self.fingerprint = None
 
     async def process_save_part(self, data, t, catalog_name):
         part_id = data.get('id')
@@ -31,39 +65,68 @@ class Category(ABC):
             catalog_name=catalog_name,
         )
 
-        t.set_postfix_str(f'{name} {part_id} FROM {self}')
-        t.update()
-        t.total = t.n * randint(2, 3)
+        if self.catalog.incremental:
+            await db_reset_detail_validated(catalog_name=catalog_name, detail_id=part_id)
 
-    @abstractmethod
-    async def fetch_parts(self, category, test_api, t):
+        if t is not None:
+            t.set_postfix_str(f'{name} {part_id} FROM {self}')
+            t.update()
+            t.total = t.n * randint(2, 3)
+
+    async def load_parts(self, category, test_api):
+        """
+        Загружает детали перечня.
+        :return: Список данных деталей (может быть пустым) или None, если ответ не получен
+        """
         data_json = await self.catalog.fetch_parts(part_list_id=self.id)
 
-        if data_json:
-            data = data_json.get('data')
+        if not data_json:
+            return None
 
-            if not data:
-                self.catalog.logger.warning(f'No details in {self.catalog}/{category}/{self}')
-                return
+        data = data_json.get('data')
 
-            if test_api:
-                data = data[:1]
+        if not data:
+            self.catalog.logger.warning(f'No details in {self.catalog}/{category}/{self}',
+                                        extra={'coalesce': f'No details in {self.catalog} parts lists'})
+            return []
+
+        return self.sample(data, test_api, leaf=True)
 
-            tasks = (self.process_save_part(data=part_data, t=t, catalog_name=self.catalog.name) for part_data in data)
+    def sample(self, data, test_api, leaf=False):
+        """
+        Отбирает потомков или детали для обхода: первый элемент при test_api,
+        выборка catalog.sampler в режиме выборки, иначе все.
+        """
+        if test_api:
+            return data[:1]
+        if self.catalog.sampler is not None:
+            return self.catalog.sampler.select(self.id, data, leaf=leaf)
+        return data
 
-            for task in asyncio.as_completed(tasks):
-                await task
+    @abstractmethod
+    async def fetch_parts(self, category, test_api, t):
+        data = await self.load_parts(category=category, test_api=test_api)
+
+        if data is None:
+            return False
+
+        for part_data in data:
+            await self.process_save_part(data=part_data, t=t, catalog_name=self.catalog.name)
+
+        return True
 
     @abstractmethod
     async def fetch_children(self, test_api, part_list):
         data_json = await self.catalog.fetch_category(category_id=self.id)
 
         if data_json:
+            self.loaded = True
             category_data = data_json.get('data')
+            self.fingerprint = fingerprint(category_data)
 
             if not category_data:
                 self.catalog.logger.warning(
-                    f'No data in {self.catalog}/{self}')
+                    f'No data in {self.catalog}/{self}', extra={'coalesce': f'No data in {self.catalog} categories'})
                 return
 
             if test_api:
@@ -93,51 +156,81 @@ class Category(ABC):
                 else:
                     children = data.get('children')
                 if not children:
-                    self.catalog.logger.warning(f'No children {self.catalog}/{self}')
+                    self.catalog.logger.warning(f'No children {self.catalog}/{self}',
+                                                extra={'coalesce': f'No children in {self.catalog} categories'})
 
                 return children
 
-            if test_api and part_list:
-                category_data = category_data[:1]
+            if part_list:
+                category_data = self.sample(category_data, test_api)
 
-            category_tasks = (fetch_children_data(data=data) for data in category_data)
+                category_tasks = (fetch_children_data(data=data) for data in category_data)
 
-            for ctr_task in asyncio.as_completed(category_tasks):
-                result = await ctr_task
+                for ctr_task in asyncio.as_completed(category_tasks):
+                    result = await ctr_task
 
-                if result:
-                    if part_list:
+                    if result:
                         child = await fetch_child_data(child_data=result)
                         if child:
                             yield child
-                    else:
-                        if test_api:
-                            result = result[:1]
-
-                        children_tasks = (fetch_child_data(child_data=child_data) for child_data in result)
-                        for child_task in asyncio.as_completed(children_tasks):
-                            child = await child_task
-                            if child:
-                                yield child
+            else:
+                # Потомки всех групп узла отбираются одной выборкой: вес узла и оценка уровня
+                # учитывают каждого потомка один раз
+                children = []
+                for result in await asyncio.gather(*(fetch_children_data(data=data) for data in category_data)):
+                    if result:
+                        children.extend(result)
+
+                if children:
+                    children = self.sample(children, test_api)
+
+                children_tasks = (fetch_child_data(child_data=child_data) for child_data in children)
+                for child_task in asyncio.as_completed(children_tasks):
+                    child = await child_task
+                    if child:
+                        yield child
         else:
             return
 
-    @abstractmethod
-    async def validate(self, data: dict):
+    @classmethod
+    def check(cls, data):
+        """
+        Проверяет данные категории по схемам класса.
+        :return: {раздел: маска отсутствующих полей} только для разделов с пропусками
+        """
+        findings = {}
+
+        mask = cls.schemas['fields'].missing(data)
+        if mask:
+            findings['fields'] = mask
+
         image_fields = data.get('imageFields')
+        if image_fields:
+            mask = cls.schemas['imageFields'].missing(image_fields)
+            if mask:
+                findings['imageFields'] = mask
 
-        missing_fields = self.validation_fields - data.keys()
+        return findings
 
-        if len(missing_fields) > 0:
-            self.catalog.logger.warning(
-                f"Missing fields {missing_fields} in {self.catalog}/{self}")
+    @abstractmethod
+    async def validate(self, data: dict):
+        findings = self.check(data)
+        root_id = getattr(self, 'root_id', self.id)
 
-        if image_fields:
-            missing_fields = self.validation_image_fields - image_fields.keys()
+        for section, mask in findings.items():
+            schema = self.schemas[section]
+            missing_fields = schema.names(mask)
 
-            if len(missing_fields) > 0:
+            if section == 'fields':
                 self.catalog.logger.warning(
-                    f"Missing fields  {missing_fields} in imageFields => in {self.catalog}/{self}")
+                    f"Missing fields {missing_fields} in {self.catalog}/{self}",
+                    extra={'coalesce': f"Missing fields {sorted(missing_fields)} in {self.catalog} categories"})
+            else:
+                self.catalog.logger.warning(
+                    f"Missing fields  {missing_fields} in imageFields => in {self.catalog}/{self}",
+                    extra={'coalesce': f"Missing fields {sorted(missing_fields)} in imageFields of {self.catalog} categories"})
+
+            await self.catalog.record_validation('category', self.id, root_id, section, schema, mask)
 
     def __str__(self):
         return f"{self.name} id:{self.id}"
@@ -147,15 +240,13 @@ class Category(ABC):
 
 
 class LemkenCategory(Category):
-
-    def __init__(self, *args, **kwargs):
-        super(LemkenCategory, self).__init__(*args, **kwargs)
-        self.validation_fields = {
-            'id', 'name', 'parent_id', 'link_type', 'children',
-            'created_at', 'updated_at', 'position', 'description',
-            'remark', 'imageFields',
-        }
-        self.validation_image_fields = {'name', 's3'}
+    __slots__ = ()
+    validation_fields = frozenset({
+        'id', 'name', 'parent_id', 'link_type', 'children',
+        'created_at', 'updated_at', 'position', 'description',
+        'remark', 'imageFields',
+    })
+    validation_image_fields = frozenset({'name', 's3'})
 
     async def validate(self, data: dict):
         await super().validate(data)
@@ -165,19 +256,17 @@ class LemkenCategory(Category):
             yield child
 
     async def fetch_parts(self, category, test_api, t):
-        await super().fetch_parts(category, test_api, t)
+        return await super().fetch_parts(category, test_api, t)
 
 
 class KubotaCategory(Category):
-
-    def __init__(self, *args, **kwargs):
-        super(KubotaCategory, self).__init__(*args, **kwargs)
-        self.validation_fields = {
-            'id', 'name', 'parent_id', 'link_type', 'children',
-            'created_at', 'updated_at', 'position', 'description',
-            'remark', 'imageFields',
-        }
-        self.validation_image_fields = {'name', 's3'}
+    __slots__ = ()
+    validation_fields = frozenset({
+        'id', 'name', 'parent_id', 'link_type', 'children',
+        'created_at', 'updated_at', 'position', 'description',
+        'remark', 'imageFields',
+    })
+    validation_image_fields = frozenset({'name', 's3'})
 
     async def validate(self, data: dict):
         await super().validate(data)
@@ -187,18 +276,19 @@ class KubotaCategory(Category):
             yield child
 
     async def fetch_parts(self, category, test_api, t):
-        await super().fetch_parts(category, test_api, t)
+        return await super().fetch_parts(category, test_api, t)
 
 
 class GrimmeCategory(Category):
+    __slots__ = ('modifications',)
+    validation_fields = frozenset({
+        'id', 'label', 'parent_id', 'linkType',
+        'children', 'created_at', 'updated_at',
+    })
 
     def __init__(self, *args, **kwargs):
         super(GrimmeCategory, self).__init__(*args, **kwargs)
         self.modifications = []
-        self.validation_fields = {
-            'id', 'label', 'parent_id', 'linkType',
-            'children', 'created_at', 'updated_at',
-        }
 
     async def validate(self, data):
         await super().validate(data)
@@ -207,15 +297,17 @@ class GrimmeCategory(Category):
         data_json = await self.catalog.fetch_category(category_id=self.id)
 
         if data_json:
+            self.loaded = True
             children = data_json.get('data')
+            self.fingerprint = fingerprint(children)
 
             if not children:
                 self.catalog.logger.warning(
-                    f'No children in data: {self.catalog.name}/{self}')
+                    f'No children in data: {self.catalog.name}/{self}',
+                    extra={'coalesce': f'No children in {self.catalog} categories'})
                 return
 
-            if test_api:
-                children = children[:1]
+            children = self.sample(children, test_api)
 
             async def fetch_child_data(child_data):
                 if child_data:
@@ -243,35 +335,33 @@ class GrimmeCategory(Category):
         else:
             return
 
-    async def fetch_parts(self, category, test_api, t):
+    async def load_parts(self, category, test_api):
         data_json = await self.catalog.fetch_category(category_id=self.id)
 
-        if data_json:
-            data = data_json.get('data')
+        if not data_json:
+            return None
 
-            if not data:
-                self.catalog.logger.warning(f'No details in {self.catalog}/{category}/{self}')
-                return
+        data = data_json.get('data')
 
-            if test_api:
-                data = data[:1]
+        if not data:
+            self.catalog.logger.warning(f'No details in {self.catalog}/{category}/{self}',
+                                        extra={'coalesce': f'No details in {self.catalog} parts lists'})
+            return []
 
-            tasks = (self.process_save_part(data=part_data, t=t) for part_data in data)
+        return self.sample(data, test_api, leaf=True)
 
-            for task in asyncio.as_completed(tasks):
-                await task
+    async def fetch_parts(self, category, test_api, t):
+        return await super().fetch_parts(category, test_api, t)
 
 
 class KroneCategory(Category):
-
-    def __init__(self, *args, **kwargs):
-        super(KroneCategory, self).__init__(*args, **kwargs)
-        self.validation_fields = {
-            'id', 'name', 'parent_id', 'link_type', 'children',
-            'created_at', 'updated_at', 'position', 'description',
-            'remark', 'imageFields',
-        }
-        self.validation_image_fields = {'name', 's3'}
+    __slots__ = ()
+    validation_fields = frozenset({
+        'id', 'name', 'parent_id', 'link_type', 'children',
+        'created_at', 'updated_at', 'position', 'description',
+        'remark', 'imageFields',
+    })
+    validation_image_fields = frozenset({'name', 's3'})
 
     async def validate(self, data: dict):
         await super().validate(data)
@@ -281,18 +371,17 @@ class KroneCategory(Category):
             yield child
 
     async def fetch_parts(self, category, test_api, t):
-        await super().fetch_parts(category, test_api, t)
+        return await super().fetch_parts(category, test_api, t)
 
 
 class KvernelandCategory(Category):
-    def __init__(self, *args, **kwargs):
-        super(KvernelandCategory, self).__init__(*args, **kwargs)
-        self.validation_fields = {
-            'id', 'name', 'parent_id', 'link_type', 'children',
-            'created_at', 'updated_at', 'position', 'description',
-            'remark', 'imageFields',
-        }
-        self.validation_image_fields = {'name', 's3'}
+    __slots__ = ()
+    validation_fields = frozenset({
+        'id', 'name', 'parent_id', 'link_type', 'children',
+        'created_at', 'updated_at', 'position', 'description',
+        'remark', 'imageFields',
+    })
+    validation_image_fields = frozenset({'name', 's3'})
 
     async def validate(self, data):
         await super().validate(data)
@@ -302,19 +391,17 @@ class KvernelandCategory(Category):
             yield child
 
     async def fetch_parts(self, category, test_api, t):
-        await super().fetch_parts(category, test_api, t)
+        return await super().fetch_parts(category, test_api, t)
 
 
 class JdeereCategory(Category):
-
-    def __init__(self, *args, **kwargs):
-        super(JdeereCategory, self).__init__(*args, **kwargs)
-        self.validation_fields = {
-            'id', 'name', 'parent_id', 'link_type', 'children',
-            'created_at', 'updated_at', 'position', 'description',
-            'remark', 'imageFields',
-        }
-        self.validation_image_fields = {'name', 's3'}
+    __slots__ = ()
+    validation_fields = frozenset({
+        'id', 'name', 'parent_id', 'link_type', 'children',
+        'created_at', 'updated_at', 'position', 'description',
+        'remark', 'imageFields',
+    })
+    validation_image_fields = frozenset({'name', 's3'})
 
     async def validate(self, data: dict):
         await super().validate(data)
@@ -324,19 +411,17 @@ class JdeereCategory(Category):
             yield child
 
     async def fetch_parts(self, category, test_api, t):
-        await super().fetch_parts(category, test_api, t)
+        return await super().fetch_parts(category, test_api, t)
 
 
 class ClaasCategory(Category):
-
-    def __init__(self, *args, **kwargs):
-        super(ClaasCategory, self).__init__(*args, **kwargs)
-        self.validation_fields = {
-            'id', 'name', 'parent_id', 'link_type', 'children',
-            'created_at', 'updated_at', 'position', 'description',
-            'remark', 'imageFields',
-        }
-        self.validation_image_fields = {'name', 's3'}
+    __slots__ = ()
+    validation_fields = frozenset({
+        'id', 'name', 'parent_id', 'link_type', 'children',
+        'created_at', 'updated_at', 'position', 'description',
+        'remark', 'imageFields',
+    })
+    validation_image_fields = frozenset({'name', 's3'})
 
     async def validate(self, data):
         await super().validate(data)
@@ -346,17 +431,16 @@ class ClaasCategory(Category):
             yield child
 
     async def fetch_parts(self, category, test_api, t):
-        await super().fetch_parts(category, test_api, t)
+        return await super().fetch_parts(category, test_api, t)
 
 
 class RopaCategory(Category):
-    def __init__(self, *args, **kwargs):
-        super(RopaCategory, self).__init__(*args, **kwargs)
-        self.validation_fields = {
-            'id', 'name', 'parent_id', 'link_type', 'children',
-            'created_at', 'updated_at', 'description', 'imageFields',
-        }
-        self.validation_image_fields = {'name', 's3'}
+    __slots__ = ()
+    validation_fields = frozenset({
+        'id', 'name', 'parent_id', 'link_type', 'children',
+        'created_at', 'updated_at', 'description', 'imageFields',
+    })
+    validation_image_fields = frozenset({'name', 's3'})
 
     async def validate(self, data):
         await super().validate(data)
@@ -366,7 +450,7 @@ class RopaCategory(Category):
             yield child
 
     async def fetch_parts(self, category, test_api, t):
-        await super().fetch_parts(category, test_api, t)
+        return await super().fetch_parts(category, test_api, t)
 
 
 async def create_category_instance(catalog, category_id, name, root_id=None):
@@ -0,0 +1,277 @@
+import asyncio
+from random import randint
+
+from database import add_parts_list, count_parts_lists_by_category, count_parts_by_category, fetch_parts_lists_batch, \
+    fetch_parts_batch, flush_db, count_crawl_nodes, fetch_pending_nodes, mark_parts_list_fetched, \
+    mark_detail_validated, reset_crawl_nodes, fetch_fingerprints, commit_fingerprints
+from src.catalog.category import create_category_instance
+from src.catalog.part import create_part_instance
+from src.catalog.traversal import Traversal
+
+
+class Crawler:
+    """
+    Последовательный обход каталога по этапам: корневые категории -> дерево категорий ->
+    детали перечней -> проверка деталей. Каждый этап читает результаты предыдущего из базы,
+    поэтому этапы можно запускать по отдельности (корневые категории нужны всем этапам).
+    progress - необязательный индикатор с интерфейсом tqdm (update, set_postfix_str, n, total).
+    """
+
+    phases = ('roots', 'tree', 'parts', 'validate')
+
+    def __init__(self, catalog, test_api=False):
+        self.catalog = catalog
+        self.test_api = test_api
+        self.stats = {
+            'roots': 0,
+            'categories': 0,
+            'parts_lists': 0,
+            'parts': 0,
+            'validated': 0,
+            'errors': 0,
+        }
+
+    async def run(self, phases=phases):
+        """
+        :param phases: Этапы в порядке выполнения, корневые категории загружаются при необходимости
+        :return: Статистика обхода
+        """
+        if 'roots' not in phases and not self.catalog.categories:
+            await self.roots()
+
+        for phase in phases:
+            await getattr(self, phase)()
+
+        return self.stats
+
+    async def roots(self, progress=None):
+        resp_json = await self.catalog.fetch_tree()
+        data = resp_json.get('data') if resp_json else None
+
+        if not data:
+            self.catalog.logger.warning(f'No data in {self.catalog.current_url} catalog: {self.catalog}')
+            return
+
+        if progress is not None:
+            progress.total = len(data)
+
+        async def process_category(category_data):
+            category = await self.catalog.add_category(data=category_data)
+            if progress is not None:
+                progress.set_postfix_str(f'{category} from {self.catalog}')
+            await category.validate(data=category_data)
+
+        tasks = (asyncio.create_task(process_category(category_data=category_data)) for category_data in data)
+        try:
+            for task in asyncio.as_completed(tasks):
+                await task
+                self.stats['roots'] += 1
+                if progress is not None:
+                    progress.update()
+        finally:
+            await flush_db()
+
+    async def tree(self, progress=None):
+        catalog = self.catalog
+
+        if not catalog.categories:
+            catalog.logger.warning(f'No Categories in {catalog}')
+            return
+
+        async def on_category(child, parent):
+            self.stats['categories'] += 1
+            if progress is not None:
+                progress.total = progress.n * randint(2, 3)
+                progress.set_postfix_str('...' * randint(1, 2))
+
+        async def on_parts_list(child, parent):
+            self.stats['parts_lists'] += 1
+            if progress is not None:
+                progress.set_postfix_str(f'{child} from {parent}')
+                progress.update()
+            await add_parts_list(
+                root_id=child.root_id,
+                parts_list_id=child.id,
+                name=child.name,
+                catalog_name=catalog.name,
+            )
+
+        fingerprints = await fetch_fingerprints(catalog_name=catalog.name) if catalog.incremental else None
+        traversal = Traversal(
+            catalog=catalog,
+            test_api=self.test_api,
+            workers=catalog.tree_workers or catalog.limiter.max_limit,
+            on_category=on_category,
+            on_parts_list=on_parts_list,
+            checkpoint=True,
+            fingerprints=fingerprints,
+        )
+        failed = catalog.retry_stats.failed
+
+        try:
+            if catalog.resume and await count_crawl_nodes(catalog_name=catalog.name):
+                # Продолжение с необработанных узлов прошлого запуска
+                for category_id, name, root_id, depth in await fetch_pending_nodes(catalog_name=catalog.name):
+                    category = await create_category_instance(
+                        catalog=catalog,
+                        category_id=category_id,
+                        name=name,
+                        root_id=root_id,
+                    )
+                    await traversal.add(category, depth)
+                await traversal.run()
+            else:
+                await reset_crawl_nodes(catalog_name=catalog.name)
+                await traversal.run(roots=list(catalog.categories.values()))
+
+            # Отпечатки сохраняются только для полностью пройденного дерева (не при test_api и выборке)
+            if not traversal.stats['errors'] and catalog.retry_stats.failed == failed and not self.test_api \
+                    and catalog.sampler is None:
+                await commit_fingerprints(catalog_name=catalog.name)
+        except Exception as error:
+            self.stats['errors'] += 1
+            catalog.logger.error(error)
+        finally:
+            self.stats['errors'] += traversal.stats['errors']
+            await flush_db()
+
+    async def parts(self, progress=None):
+        catalog = self.catalog
+        parts_lists_counts = await count_parts_lists_by_category(catalog_name=catalog.name)
+
+        async def process_parts_list(parts_list_data, category):
+            if self.expired:
+                return False
+
+            parts_list_id, name, root_id = parts_list_data
+
+            parts_list = await create_category_instance(
+                catalog=catalog,
+                category_id=parts_list_id,
+                name=name,
+                root_id=root_id,
+            )
+            if await parts_list.fetch_parts(category=category, test_api=self.test_api, t=progress):
+                await mark_parts_list_fetched(catalog_name=catalog.name, parts_list_id=parts_list_id)
+                return True
+            return False
+
+        try:
+            for category in list(catalog.categories.values()):
+                if not parts_lists_counts.get(category.id):
+                    continue
+
+                async for parts_lists in self._batches(
+                        fetch_parts_lists_batch, category_id=category.id, batch_size=50):
+                    tasks = (asyncio.create_task(process_parts_list(parts_list_data=parts_list_data, category=category))
+                             for parts_list_data in parts_lists)
+
+                    for task in asyncio.as_completed(tasks):
+                        if await task and self.test_api:
+                            return
+        except Exception as error:
+            self.stats['errors'] += 1
+            catalog.logger.error(error)
+        finally:
+            await flush_db()
+            self.stats['parts'] = sum((await count_parts_by_category(catalog_name=catalog.name)).values())
+
+    async def validate(self, progress=None):
+        catalog = self.catalog
+        parts_counts = await count_parts_by_category(catalog_name=catalog.name)
+        categories = list(catalog.categories.values())
+
+        if progress is not None:
+            progress.total = sum(parts_counts.get(category.id, 0) for category in categories)
+
+        async def process_validation(part_data, category):
+            if self.expired:
+                return
+
+            detail_id, name, _ = part_data
+            part = await create_part_instance(
+                catalog=catalog,
+                category=category,
+                part_id=detail_id,
+                name=name,
+            )
+            if await part.validate(progress=progress):
+                await mark_detail_validated(catalog_name=catalog.name, detail_id=detail_id)
+                self.stats['validated'] += 1
+                if catalog.sampler is not None:
+                    catalog.sampler.validated += 1
+
+        try:
+            # Архив ответов открыт только в этом процессе, поэтому с --cassette проверка идёт здесь
+            if catalog.validation_shards > 1 and not self.test_api and catalog.cassette is None:
+                from src.catalog.sharding import ShardedValidation
+
+                validation = ShardedValidation(
+                    catalog=catalog,
+                    shards=catalog.validation_shards,
+                    pending_only=catalog.resume or catalog.incremental,
+                    progress=progress,
+                )
+                await validation.run()
+                self.stats['validated'] += validation.stats['validated']
+                if catalog.sampler is not None:
+                    catalog.sampler.validated += validation.stats['validated']
+                self.stats['errors'] += validation.stats['errors']
+                return
+
+            for category in categories:
+                if not parts_counts.get(category.id):
+                    continue
+
+                validated = False
+
+                async for parts in self._batches(fetch_parts_batch, category_id=category.id, batch_size=500):
+                    tasks = [asyncio.create_task(process_validation(part_data=part_data, category=category))
+                             for part_data in parts]
+
+                    for task in asyncio.as_completed(tasks):
+                        await task
+
+                    validated = True
+
+                if validated and self.test_api:
+                    return
+        except Exception as error:
+            self.stats['errors'] += 1
+            catalog.logger.error(error)
+        finally:
+            await flush_db()
+
+    @property
+    def expired(self):
+        """
+        Время выборочного обхода исчерпано, оставшиеся перечни и детали пропускаются.
+        """
+        return self.catalog.sampler is not None and self.catalog.sampler.expired
+
+    async def _batches(self, fetch, category_id, batch_size):
+        """
+        Постраничное чтение перечней или деталей категории по возрастанию id.
+        С resume/incremental читаются только необработанные записи.
+        """
+        after_id = -1
+
+        while not self.expired:
+            batch = await fetch(
+                category_id=category_id,
+                batch_size=batch_size,
+                after_id=after_id,
+                catalog_name=self.catalog.name,
+                pending_only=self.catalog.resume or self.catalog.incremental,
+            )
+
+            if batch:
+                yield batch
+
+            if len(batch) < batch_size:
+                return
+
+            after_id = batch[-1][0]
+
+    def __str__(self):
+        return ' '.join(f'{key} {value}' for key, value in self.stats.items())
@@ -0,0 +1,103 @@
+import asyncio
+from collections import deque
+
+
+class AdaptiveLimiter:
+    """
+    Ограничитель параллельных запросов с адаптивным окном (AIMD).
+    Окно растёт на increase за каждое полное окно успешных ответов, пока задержка
+    не превышает минимальную в latency_tolerance раз, а сглаженная доля ошибок -
+    error_tolerance, и умножается на decrease
+    при таймаутах, 429 и 5xx (не чаще одного раза за время ответа).
+    """
+
+    def __init__(self, initial=20, min_limit=1, max_limit=500, increase=1.0, decrease=0.5,
+                 latency_tolerance=3.0, error_tolerance=0.05, smoothing=0.1):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_tolerance = latency_tolerance
+        self.error_tolerance = error_tolerance
+        self.smoothing = smoothing
+
+        self.in_flight = 0
+        self.latency = None
+        self.min_latency = None
+        self.error_rate = 0.0
+        self.completed = 0
+        self.overloads = 0
+        self._last_decrease = 0.0
+        self._waiters = deque()
+
+    @property
+    def window(self):
+        return max(self.min_limit, int(self.limit))
+
+    async def acquire(self):
+        while self.in_flight >= self.window:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                self._wake()
+                raise
+        self.in_flight += 1
+
+    def release(self, latency, overloaded=False):
+        """
+        Освобождает слот и корректирует окно.
+        :param latency: Время выполнения запроса (в секундах)
+        :param overloaded: Признак перегрузки сервера (таймаут, 429, 5xx)
+        """
+        self.in_flight -= 1
+        self.completed += 1
+        self.error_rate += self.smoothing * ((1.0 if overloaded else 0.0) - self.error_rate)
+
+        if overloaded:
+            self.overloads += 1
+            now = asyncio.get_running_loop().time()
+            if now - self._last_decrease >= (self.latency or 0.0):
+                self.limit = max(self.min_limit, self.limit * self.decrease)
+                self._last_decrease = now
+        else:
+            if self.latency is None:
+                self.latency = latency
+            else:
+                self.latency += self.smoothing * (latency - self.latency)
+
+            if self.min_latency is None or latency < self.min_latency:
+                self.min_latency = latency
+
+            if self.latency <= self.min_latency * self.latency_tolerance and self.error_rate <= self.error_tolerance:
+                self.limit = min(self.max_limit, self.limit + self.increase / self.window)
+
+        self._wake()
+
+    def _wake(self):
+        free = self.window - self.in_flight
+        while free > 0 and self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+    def stats(self):
+        return {
+            'window': self.window,
+            'in_flight': self.in_flight,
+            'waiting': len(self._waiters),
+            'latency': self.latency,
+            'min_latency': self.min_latency,
+            'error_rate': self.error_rate,
+            'completed': self.completed,
+            'overloads': self.overloads,
+        }
+
+    def __str__(self):
+        latency = f"{self.latency * 1000:.0f}ms" if self.latency is not None else '-'
+        return f"window {self.window} in flight {self.in_flight} latency {latency}"
@@ -0,0 +1,83 @@
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+
+class CoalescingHandler(logging.Handler):
+    """
+    Обёртка над обработчиком: записи с одинаковым ключом extra={'coalesce': key}
+    пишутся только первые sample раз, остальные считаются. При закрытии для каждого
+    повторявшегося ключа пишется итог вида "<key> ×41,233".
+    """
+
+    def __init__(self, target, sample=5):
+        super().__init__(level=target.level)
+        self.target = target
+        self.sample = sample
+        self.counts = dict()
+        self.levels = dict()
+
+    def emit(self, record):
+        key = getattr(record, 'coalesce', None)
+        if key is None:
+            self.target.handle(record)
+            return
+
+        count = self.counts.get(key, 0) + 1
+        self.counts[key] = count
+        self.levels[key] = max(self.levels.get(key, record.levelno), record.levelno)
+        if count <= self.sample:
+            self.target.handle(record)
+
+    def summarize(self):
+        for key, count in sorted(self.counts.items(), key=lambda item: -item[1]):
+            if count > 1:
+                record = logging.LogRecord(
+                    name='summary', level=self.levels[key], pathname=__file__, lineno=0,
+                    msg=f'{key} ×{count:,}', args=None, exc_info=None,
+                )
+                self.target.handle(record)
+        self.counts.clear()
+        self.levels.clear()
+
+    def setFormatter(self, fmt):
+        self.target.setFormatter(fmt)
+
+    def close(self):
+        self.summarize()
+        self.target.close()
+        super().close()
+
+
+def setup_queue_logger(name, log_file, level=logging.WARNING, sample=5):
+    """
+    Логгер, который только кладёт записи в очередь: запись в файл выполняет
+    фоновый поток QueueListener, поэтому предупреждения не блокируют цикл событий.
+    :return: (logger, listener); listener.stop() дописывает очередь и итоги повторов
+    """
+    logger = logging.getLogger(name)
+    logger.setLevel(level)
+
+    # Повторное создание каталога с тем же именем не должно дублировать строки
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
+
+    file_handler = logging.FileHandler(log_file)
+    file_handler.setLevel(level)
+    file_handler.setFormatter(
+        logging.Formatter('%(asctime)s [%(levelname)s] %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+    )
+
+    coalescing_handler = CoalescingHandler(file_handler, sample=sample)
+    listener = QueueListener(queue.SimpleQueue(), coalescing_handler, respect_handler_level=True)
+    logger.addHandler(QueueHandler(listener.queue))
+    listener.start()
+
+    return logger, listener
+
+
+def stop_queue_logger(listener):
+    listener.stop()
+    for handler in listener.handlers:
+        handler.close()
@@ -0,0 +1,227 @@
+import json
+import os
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from functools import wraps
+
+
+class Histogram:
+    """
+    Гистограмма с фиксированными границами корзин (накопительная при выводе, как в Prometheus).
+    """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.max = max(self.max, value)
+
+    def quantile(self, share):
+        """
+        Оценка квантиля по верхней границе корзины (за последней границей - максимум).
+        """
+        if not self.count:
+            return None
+        target = share * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return self.max
+
+    def merge(self, counts, total, count, maximum):
+        for index, value in enumerate(counts):
+            self.counts[index] += value
+        self.sum += total
+        self.count += count
+        self.max = max(self.max, maximum)
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(list(self.buckets) + [float('inf')], self.counts):
+            total += count
+            yield bound, total
+
+
+class Metrics:
+    """
+    Реестр счётчиков и гистограмм с метками. Метрики пишутся в конце запуска
+    в текстовом формате Prometheus и в JSON.
+    """
+    latency_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+    db_buckets = (0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+
+    def __init__(self, prefix='partstest'):
+        self.prefix = prefix
+        self.counters = defaultdict(int)
+        self.histograms = dict()
+        self.help = dict()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def describe(self, name, text):
+        self.help[name] = text
+
+    def inc(self, name, value=1, **labels):
+        self.counters[self._key(name, labels)] += value
+
+    def observe(self, name, value, buckets=None, **labels):
+        key = self._key(name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram(buckets or self.latency_buckets)
+        histogram.observe(value)
+
+    def timed(self, name, buckets=None, **labels):
+        """
+        Декоратор асинхронной функции: время выполнения пишется в гистограмму name
+        с меткой query=<имя функции>.
+        """
+        def decorator(func):
+            @wraps(func)
+            async def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    self.observe(name, time.perf_counter() - started, buckets=buckets, query=func.__name__, **labels)
+            return wrapper
+        return decorator
+
+    def clear(self):
+        self.counters.clear()
+        self.histograms.clear()
+
+    def snapshot(self):
+        """
+        Значения метрик для передачи из процесса-обработчика (см. merge).
+        """
+        return {
+            'counters': list(self.counters.items()),
+            'histograms': [
+                (key, histogram.buckets, histogram.counts, histogram.sum, histogram.count, histogram.max)
+                for key, histogram in self.histograms.items()
+            ],
+        }
+
+    def merge(self, snapshot):
+        """
+        Добавляет к реестру метрики другого процесса (результат snapshot).
+        """
+        for key, value in snapshot['counters']:
+            self.counters[key] += value
+
+        for key, buckets, counts, total, count, maximum in snapshot['histograms']:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.merge(counts, total, count, maximum)
+
+    @staticmethod
+    def _matches(labels, selector):
+        labels = dict(labels)
+        return all(labels.get(key) == str(value) for key, value in selector.items())
+
+    @staticmethod
+    def _format_labels(labels, extra=()):
+        items = list(labels) + list(extra)
+        if not items:
+            return ''
+        text = ','.join(f'{key}="{str(value).replace(chr(34), chr(39))}"' for key, value in items)
+        return f'{{{text}}}'
+
+    def to_prometheus(self, **selector):
+        """
+        :param selector: Отбор по меткам, например catalog='lemken'
+        """
+        lines = []
+        typed = set()
+
+        for (name, labels), value in sorted(self.counters.items()):
+            if not self._matches(labels, selector):
+                continue
+            metric = f'{self.prefix}_{name}'
+            if metric not in typed:
+                typed.add(metric)
+                if name in self.help:
+                    lines.append(f'# HELP {metric} {self.help[name]}')
+                lines.append(f'# TYPE {metric} counter')
+            lines.append(f'{metric}{self._format_labels(labels)} {value}')
+
+        for (name, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+            if not self._matches(labels, selector):
+                continue
+            metric = f'{self.prefix}_{name}'
+            if metric not in typed:
+                typed.add(metric)
+                if name in self.help:
+                    lines.append(f'# HELP {metric} {self.help[name]}')
+                lines.append(f'# TYPE {metric} histogram')
+            for bound, total in histogram.cumulative():
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{metric}_bucket{self._format_labels(labels, [("le", le)])} {total}')
+            lines.append(f'{metric}_sum{self._format_labels(labels)} {histogram.sum:.6f}')
+            lines.append(f'{metric}_count{self._format_labels(labels)} {histogram.count}')
+
+        return '\n'.join(lines) + '\n'
+
+    def to_dict(self, **selector):
+        counters = defaultdict(list)
+        for (name, labels), value in sorted(self.counters.items()):
+            if self._matches(labels, selector):
+                counters[name].append({**dict(labels), 'value': value})
+
+        histograms = defaultdict(list)
+        for (name, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+            if self._matches(labels, selector):
+                histograms[name].append({
+                    **dict(labels),
+                    'count': histogram.count,
+                    'sum': round(histogram.sum, 6),
+                    'mean': round(histogram.sum / histogram.count, 6) if histogram.count else None,
+                    'p50': histogram.quantile(0.5),
+                    'p99': histogram.quantile(0.99),
+                    'max': round(histogram.max, 6),
+                })
+
+        return {'counters': dict(counters), 'histograms': dict(histograms)}
+
+    def write(self, directory='metrics', name='metrics', **selector):
+        """
+        Записывает <name>.prom и <name>.json в directory.
+        :return: Пути к файлам
+        """
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        prom_path = os.path.join(directory, f'{name}.prom')
+        json_path = os.path.join(directory, f'{name}.json')
+
+        with open(prom_path, 'w') as file:
+            file.write(self.to_prometheus(**selector))
+        with open(json_path, 'w') as file:
+            json.dump(self.to_dict(**selector), file, indent=2, ensure_ascii=False)
+
+        return prom_path, json_path
+
+
+metrics = Metrics()
+metrics.describe('requests_total', 'API responses by catalog, endpoint and status')
+metrics.describe('response_bytes_total', 'API response body bytes')
+metrics.describe('retries_total', 'Repeated API requests')
+metrics.describe('failed_requests_total', 'API requests given up after retries')
+metrics.describe('request_seconds', 'API request attempt latency')
+metrics.describe('db_write_seconds', 'Batched database write time per statement')
+metrics.describe('db_rows_total', 'Rows written to the database per statement')
+metrics.describe('db_read_seconds', 'Database read helper time')
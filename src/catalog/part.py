@@ -1,53 +1,132 @@
 import asyncio
 from abc import ABC, abstractmethod
 
+from src.catalog.schema import compile_schemas
+
 
 class Part(ABC):
+    __slots__ = ('catalog', 'category', 'id', 'name')
+    # Обязательные поля задаются на уровне класса и компилируются в схемы при объявлении подкласса
+    validation_fields = frozenset()
+    validation_image_fields = frozenset()
+    validation_category_fields = frozenset()
+    # Вложенные разделы, которые должны быть в данных любой детали (непустыми)
+    validation_sections = frozenset({'category'})
+    schema_sections = {
+        'fields': 'validation_fields',
+        'imageFields': 'validation_image_fields',
+        'category': 'validation_category_fields',
+        'sections': 'validation_sections',
+    }
+    schemas = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.schemas = compile_schemas(cls, cls.schema_sections)
 
     def __init__(self, *args, **kwargs):
         self.catalog = kwargs.get('catalog')
         self.category = kwargs.get('category')
         self.id = kwargs.get('part_id')
         self.name = kwargs.get('name')
-        self.validation_fields = set()
-        self.validation_image_fields = set()
-        self.validation_category_fields = set()
+
+    @classmethod
+    def check(cls, data):
+        """
+        Проверяет данные детали по схемам класса.
+        :return: {раздел: маска отсутствующих полей} только для разделов с пропусками,
+            отсутствующие вложенные разделы - в разделе 'sections'
+        """
+        schemas = cls.schemas
+        findings = {}
+
+        mask = schemas['fields'].missing(data)
+        if mask:
+            findings['fields'] = mask
+
+        image_fields = data.get('imageFields')
+        if image_fields:
+            mask = schemas['imageFields'].missing(image_fields)
+            if mask:
+                findings['imageFields'] = mask
+
+        sections = schemas['sections']
+        mask = sections.missing({section for section in sections.fields if data.get(section)})
+        if mask:
+            findings['sections'] = mask
+
+        part_category = data.get('category')
+        if part_category:
+            mask = schemas['category'].missing(part_category)
+            if mask:
+                findings['category'] = mask
+
+        return findings
+
+    @classmethod
+    def check_batch(cls, payloads):
+        """
+        Проверка списка данных деталей одним вызовом.
+        :return: Список результатов check в том же порядке
+        """
+        check = cls.check
+        return [check(data) for data in payloads]
+
+    async def report(self, findings):
+        """
+        Пишет результаты check в лог и в validation_results.
+        """
+        category_id = self.category.id if self.category is not None else None
+
+        for section, mask in findings.items():
+            schema = self.schemas[section]
+
+            missing_fields = schema.names(mask)
+            if section == 'sections':
+                self.catalog.logger.warning(
+                    f'No part_{"/".join(sorted(missing_fields))} in {self.catalog}/{self.category}/{self}',
+                    extra={'coalesce': f'No part_{"/".join(sorted(missing_fields))} in {self.catalog} parts'})
+            elif section == 'fields':
+                self.catalog.logger.warning(
+                    f"Missing fields {missing_fields} in {self.catalog}/{self.category}/{self}",
+                    extra={'coalesce': f"Missing fields {sorted(missing_fields)} in {self.catalog} parts"})
+            elif section == 'imageFields':
+                self.catalog.logger.warning(
+                    f"Missing fields  {missing_fields} in imageFields => {self.catalog}/{self.category}/{self}",
+                    extra={'coalesce': f"Missing fields {sorted(missing_fields)} in imageFields of {self.catalog} parts"})
+            else:
+                self.catalog.logger.warning(
+                    f'Missing fields {missing_fields} in {self.catalog}/{self.category}/{self}',
+                    extra={'coalesce': f"Missing fields {sorted(missing_fields)} in category of {self.catalog} parts"})
+
+            await self.catalog.record_validation('part', self.id, category_id, section, schema, mask)
+
+    async def load(self, progress=None):
+        """
+        Получает данные детали для проверки.
+        :return: Ответ API или None, если запрос не выполнен
+        """
+        if progress is not None:
+            progress.set_postfix_str(f'{self}')
+            progress.update()
+
+        return await self.catalog.fetch_part(part_id=self.id)
 
     @abstractmethod
     async def validate(self, progress):
-        progress.set_postfix_str(f'{self}')
-        progress.update()
-
-        data_json = await self.catalog.fetch_part(part_id=self.id)
+        data_json = await self.load(progress)
 
         if data_json:
             data = data_json.get('data')
 
             if data:
-                image_fields = data.get('imageFields')
-                part_category = data.get('category')
-
-                missing_fields = self.validation_fields - data.keys()
-
-                if len(missing_fields) > 0:
-                    self.catalog.logger.warning(
-                        f"Missing fields {missing_fields} in {self.catalog}/{self.category}/{self}")
+                findings = self.check(data)
+                if findings:
+                    await self.report(findings)
 
-                if image_fields:
-                    missing_fields = self.validation_image_fields - image_fields.keys()
+            return True
 
-                    if len(missing_fields) > 0:
-                        self.catalog.logger.warning(
-                            f"Missing fields  {missing_fields} in imageFields => {self.catalog}/{self.category}/{self}")
-
-                if part_category:
-                    missing_fields = self.validation_category_fields - part_category.keys()
-
-                    if len(missing_fields) > 0:
-                        self.catalog.logger.warning(
-                            f'Missing fields {missing_fields} in {self.catalog}/{self.category}/{self}')
-                else:
-                    self.catalog.logger.warning(f'No part_category in {self.catalog}/{self.category}/{self}')
+        return False
 
     def __str__(self):
         return f"{self.name} id:{self.id}"
@@ -57,123 +136,112 @@ class Part(ABC):
 
 
 class LemkenPart(Part):
-
-    def __init__(self, *args, **kwargs):
-        super(LemkenPart, self).__init__(*args, **kwargs)
-        self.validation_fields = {
-            'id', 'name', 'link_type', 'quantity',
-            'part_number', 'position', 'dimension',
-            'imageFields', 'created_at', 'updated_at',
-        }
-        self.validation_image_fields = {'name', 's3'}
-        self.validation_category_fields = {'id'}
+    __slots__ = ()
+    validation_fields = frozenset({
+        'id', 'name', 'link_type', 'quantity',
+        'part_number', 'position', 'dimension',
+        'imageFields', 'created_at', 'updated_at',
+    })
+    validation_image_fields = frozenset({'name', 's3'})
+    validation_category_fields = frozenset({'id'})
 
     async def validate(self, progress):
-        await super().validate(progress)
+        return await super().validate(progress)
 
 
 class KubotaPart(Part):
-    def __init__(self, *args, **kwargs):
-        super(KubotaPart, self).__init__(*args, **kwargs)
-        self.validation_fields = {
-            'id', 'name', 'link_type', 'quantity',
-            'part_number', 'position', 'dimension',
-            'imageFields', 'created_at', 'updated_at',
-        }
-        self.validation_image_fields = {'name', 's3'}
-        self.validation_category_fields = {'id'}
+    __slots__ = ()
+    validation_fields = frozenset({
+        'id', 'name', 'link_type', 'quantity',
+        'part_number', 'position', 'dimension',
+        'imageFields', 'created_at', 'updated_at',
+    })
+    validation_image_fields = frozenset({'name', 's3'})
+    validation_category_fields = frozenset({'id'})
 
     async def validate(self, progress):
-        await super().validate(progress)
+        return await super().validate(progress)
 
 
 class ClaasPart(Part):
-    def __init__(self, *args, **kwargs):
-        super(ClaasPart, self).__init__(*args, **kwargs)
-        self.validation_fields = {
-            'id', 'name', 'link_type', 'quantity',
-            'part_number', 'position', 'dimension',
-            'imageFields', 'created_at', 'updated_at',
-        }
-        self.validation_image_fields = {'name', 's3'}
-        self.validation_category_fields = {'id'}
+    __slots__ = ()
+    validation_fields = frozenset({
+        'id', 'name', 'link_type', 'quantity',
+        'part_number', 'position', 'dimension',
+        'imageFields', 'created_at', 'updated_at',
+    })
+    validation_image_fields = frozenset({'name', 's3'})
+    validation_category_fields = frozenset({'id'})
 
     async def validate(self, progress):
-        await super().validate(progress)
+        return await super().validate(progress)
 
 
 class RopaPart(Part):
-
-    def __init__(self, *args, **kwargs):
-        super(RopaPart, self).__init__(*args, **kwargs)
-        self.validation_fields = {
-            'id', 'name', 'link_type', 'quantity',
-            'part_number', 'position', 'imageFields',
-            'created_at', 'updated_at',
-        }
-        self.validation_image_fields = {'name', 's3'}
-        self.validation_category_fields = {'id'}
+    __slots__ = ()
+    validation_fields = frozenset({
+        'id', 'name', 'link_type', 'quantity',
+        'part_number', 'position', 'imageFields',
+        'created_at', 'updated_at',
+    })
+    validation_image_fields = frozenset({'name', 's3'})
+    validation_category_fields = frozenset({'id'})
 
     async def validate(self, progress):
-        await super().validate(progress)
+        return await super().validate(progress)
 
 
 class GrimmePart(Part):
-
-    def __init__(self, *args, **kwargs):
-        super(GrimmePart, self).__init__(*args, **kwargs)
-        self.validation_fields = {
-            'id', 'name', 'link_type', 'quantity',
-            'partNumber', 'position', 'created_at',
-            'updated_at',
-        }
+    __slots__ = ()
+    validation_fields = frozenset({
+        'id', 'name', 'link_type', 'quantity',
+        'partNumber', 'position', 'created_at',
+        'updated_at',
+    })
 
     async def validate(self, progress):
-        await super().validate(progress)
+        return await super().validate(progress)
 
 
 class KronePart(Part):
-    def __init__(self, *args, **kwargs):
-        super(KronePart, self).__init__(*args, **kwargs)
-        self.validation_fields = {
-            'id', 'name', 'link_type', 'quantity',
-            'part_number', 'position', 'dimension',
-            'imageFields', 'created_at', 'updated_at',
-        }
-        self.validation_image_fields = {'name', 's3'}
-        self.validation_category_fields = {'id'}
+    __slots__ = ()
+    validation_fields = frozenset({
+        'id', 'name', 'link_type', 'quantity',
+        'part_number', 'position', 'dimension',
+        'imageFields', 'created_at', 'updated_at',
+    })
+    validation_image_fields = frozenset({'name', 's3'})
+    validation_category_fields = frozenset({'id'})
 
     async def validate(self, progress):
-        await super().validate(progress)
+        return await super().validate(progress)
 
 
 class KvernelandPart(Part):
-    def __init__(self, *args, **kwargs):
-        super(KvernelandPart, self).__init__(*args, **kwargs)
-        self.validation_fields = {
-            'id', 'name', 'link_type', 'quantity',
-            'part_number', 'position', 'dimension',
-            'imageFields', 'created_at', 'updated_at',
-        }
-        self.validation_image_fields = {'name', 's3'}
-        self.validation_category_fields = {'id'}
+    __slots__ = ()
+    validation_fields = frozenset({
+        'id', 'name', 'link_type', 'quantity',
+        'part_number', 'position', 'dimension',
+        'imageFields', 'created_at', 'updated_at',
+    })
+    validation_image_fields = frozenset({'name', 's3'})
+    validation_category_fields = frozenset({'id'})
 
     async def validate(self, progress):
-        await super().validate(progress)
+        return await super().validate(progress)
 
 
 class JdeerePart(Part):
-    def __init__(self, *args, **kwargs):
-        super(JdeerePart, self).__init__(*args, **kwargs)
-        self.validation_fields = {
-            'id', 'name', 'link_type', 'quantity',
-            'part_number', 'position', 's3_image_name',
-            'created_at', 'updated_at',
-        }
-        self.validation_category_fields = {'id'}
+    __slots__ = ()
+    validation_fields = frozenset({
+        'id', 'name', 'link_type', 'quantity',
+        'part_number', 'position', 's3_image_name',
+        'created_at', 'updated_at',
+    })
+    validation_category_fields = frozenset({'id'})
 
     async def validate(self, progress):
-        await super().validate(progress)
+        return await super().validate(progress)
 
 
 async def create_part_instance(catalog, category, part_id, name):
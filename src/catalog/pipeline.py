@@ -0,0 +1,152 @@
+import asyncio
+from collections import OrderedDict
+
+from database import add_parts_list as db_add_parts_list, add_detail as db_add_detail, flush_db
+from src.catalog.part import create_part_instance
+from src.catalog.traversal import Traversal
+
+
+class Pipeline:
+    """
+    Конвейерный обход каталога: корневые категории -> обход поддеревьев (Traversal) ->
+    получение деталей перечней -> проверка деталей. Этапы связаны ограниченными
+    очередями и работают одновременно, запись в базу остаётся побочным выходом для отчётов.
+    Повторно встреченные детали отсеиваются по окну последних seen_parts_size id: деталь,
+    вышедшая из окна, может быть проверена ещё раз, но память не растёт с размером каталога.
+    """
+
+    def __init__(self, catalog, test_api=False, walkers=8, fetchers=16, validators=64, queue_size=1000,
+                 seen_parts_size=100000, progress=None):
+        self.catalog = catalog
+        self.test_api = test_api
+        self.walkers = walkers
+        self.fetchers = fetchers
+        self.validators = validators
+        self.progress = progress
+
+        self.parts_lists = asyncio.Queue(maxsize=queue_size)
+        self.parts = asyncio.Queue(maxsize=queue_size)
+
+        self.seen_parts_size = seen_parts_size
+        self._seen_parts = OrderedDict()
+        self.stats = {
+            'roots': 0,
+            'categories': 0,
+            'parts_lists': 0,
+            'parts': 0,
+            'validated': 0,
+            'errors': 0,
+        }
+
+    async def run(self):
+        fetchers = [asyncio.create_task(self._worker(self.parts_lists, self._fetch_parts)) for _ in range(self.fetchers)]
+        validators = [asyncio.create_task(self._worker(self.parts, self._validate)) for _ in range(self.validators)]
+
+        try:
+            roots = await self._produce_roots()
+            traversal = Traversal(
+                catalog=self.catalog,
+                test_api=self.test_api,
+                workers=self.walkers,
+                on_category=self._on_category,
+                on_parts_list=self._on_parts_list,
+            )
+            await traversal.run(roots=roots)
+            await self._close_stage(self.parts_lists, fetchers)
+            await self._close_stage(self.parts, validators)
+        finally:
+            for task in fetchers + validators:
+                if not task.done():
+                    task.cancel()
+            await flush_db()
+
+        return self.stats
+
+    @staticmethod
+    async def _close_stage(queue, workers):
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+
+    async def _worker(self, queue, handler):
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            try:
+                await handler(item)
+            except Exception as error:
+                self.stats['errors'] += 1
+                self.catalog.logger.error(f'{self.catalog} pipeline: {error}')
+
+    async def _produce_roots(self):
+        resp_json = await self.catalog.fetch_tree()
+        data = resp_json.get('data') if resp_json else None
+
+        if not data:
+            self.catalog.logger.warning(f'No data in {self.catalog.current_url} catalog: {self.catalog}')
+            return []
+
+        roots = []
+        for category_data in data:
+            category = await self.catalog.add_category(data=category_data)
+            await category.validate(data=category_data)
+            self.stats['roots'] += 1
+            roots.append(category)
+
+        return roots
+
+    async def _on_category(self, child, parent):
+        self.stats['categories'] += 1
+
+    async def _on_parts_list(self, child, parent):
+        await db_add_parts_list(
+            root_id=child.root_id,
+            parts_list_id=child.id,
+            name=child.name,
+            catalog_name=self.catalog.name,
+        )
+        self.stats['parts_lists'] += 1
+        await self.parts_lists.put(child)
+
+    async def _fetch_parts(self, parts_list):
+        category = self.catalog.categories.get(parts_list.root_id)
+
+        for part_data in await parts_list.load_parts(category=category, test_api=self.test_api) or []:
+            part_id = part_data.get('id')
+            name = part_data.get(parts_list.name_label_part)
+
+            await db_add_detail(
+                detail_id=part_id,
+                name=name,
+                category_id=parts_list.root_id,
+                catalog_name=self.catalog.name,
+            )
+
+            if part_id in self._seen_parts:
+                self._seen_parts.move_to_end(part_id)
+                continue
+
+            self._seen_parts[part_id] = None
+            if len(self._seen_parts) > self.seen_parts_size:
+                self._seen_parts.popitem(last=False)
+            self.stats['parts'] += 1
+            if self.progress is not None:
+                self.progress.total = self.stats['parts']
+            await self.parts.put((part_id, name, category))
+
+    async def _validate(self, item):
+        part_id, name, category = item
+        part = await create_part_instance(
+            catalog=self.catalog,
+            category=category,
+            part_id=part_id,
+            name=name,
+        )
+        await part.validate(progress=self.progress)
+        self.stats['validated'] += 1
+        if self.catalog.sampler is not None:
+            self.catalog.sampler.validated += 1
+
+    def __str__(self):
+        return ' '.join(f'{key} {value}' for key, value in self.stats.items())
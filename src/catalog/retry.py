@@ -0,0 +1,70 @@
+import random
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+
+class RetryPolicy:
+    """
+    Политика повторных запросов: экспоненциальная задержка с полным джиттером,
+    общий бюджет времени на запрос и учёт заголовка Retry-After.
+    """
+    retryable_statuses = frozenset({408, 425, 429, 500, 502, 503, 504})
+
+    def __init__(self, retries=6, base_delay=0.5, max_delay=30, deadline=180, timeout=60):
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.timeout = timeout
+
+    def is_retryable(self, status):
+        return status in self.retryable_statuses or status >= 500
+
+    def backoff(self, attempt, retry_after=None):
+        """
+        Задержка перед следующей попыткой.
+        :param attempt: Номер неудачной попытки (с 1)
+        :param retry_after: Задержка из заголовка Retry-After (в секундах), выдерживается полностью:
+            max_delay её не ограничивает, при выходе за deadline запрос не повторяется
+        """
+        if retry_after is not None:
+            return retry_after
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    @staticmethod
+    def parse_retry_after(value):
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            date = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if date.tzinfo is None:
+            date = date.replace(tzinfo=timezone.utc)
+        return max(0.0, (date - datetime.now(timezone.utc)).total_seconds())
+
+
+class RetryStats:
+
+    def __init__(self):
+        self.requests = 0
+        self.retries = 0
+        self.backoff_time = 0.0
+        self.failed = 0
+        self.deadline_exceeded = 0
+
+    def as_dict(self):
+        return {
+            'requests': self.requests,
+            'retries': self.retries,
+            'backoff_time': round(self.backoff_time, 3),
+            'failed': self.failed,
+            'deadline_exceeded': self.deadline_exceeded,
+        }
+
+    def __str__(self):
+        return f"retries {self.retries} backoff {self.backoff_time:.1f}s failed {self.failed}"
@@ -0,0 +1,112 @@
+import math
+import time
+from random import Random
+
+
+class Sampler:
+    """
+    Выборочный обход каталога. У каждого узла дерева выбирается доля fraction (не меньше одного)
+    или не больше fanout потомков, поэтому в выборку попадают все корневые категории и все уровни.
+    Выбор детерминирован seed и id родителя и не зависит от порядка ответов:
+    'random' - случайные элементы, 'stratified' - по одному из равных частей списка.
+    После time_budget секунд новые узлы не раскрываются.
+    Для оценки покрытия каждому выбранному узлу назначается вес (1 / вероятность попасть
+    в выборку), сумма весов родителей, умноженных на число потомков, оценивает размер уровня.
+    """
+
+    def __init__(self, fraction=None, fanout=None, seed=0, method='random', time_budget=None):
+        if fraction is not None and not 0 < fraction <= 1:
+            raise ValueError(f"Sample fraction must be in (0, 1], got {fraction}")
+        if method not in ('random', 'stratified'):
+            raise ValueError(f"Unknown sampling method {method}")
+
+        self.fraction = fraction
+        self.fanout = fanout
+        self.seed = seed
+        self.method = method
+        self.time_budget = time_budget
+        self.started = time.monotonic()
+
+        # id выбранного узла -> (вес, глубина)
+        self.nodes = dict()
+        # уровень (глубина или 'parts') -> [выбрано, оценка размера]
+        self.levels = dict()
+        # Проверенные детали (при исчерпании времени проверяются не все полученные)
+        self.validated = 0
+
+    @property
+    def expired(self):
+        return self.time_budget is not None and time.monotonic() - self.started > self.time_budget
+
+    def size(self, count):
+        size = count
+        if self.fraction is not None:
+            size = min(size, max(1, math.ceil(count * self.fraction)))
+        if self.fanout is not None:
+            size = min(size, self.fanout)
+        return size
+
+    def select(self, parent_id, items, leaf=False):
+        """
+        Выбирает потомков узла.
+        :param parent_id: id раскрываемого узла (корневые категории имеют вес 1 и глубину 1)
+        :param items: Данные потомков
+        :param leaf: Потомки - детали перечня, они не раскрываются дальше
+        :return: Выбранные элементы в исходном порядке
+        """
+        count = len(items)
+        weight, depth = self.nodes.get(parent_id, (1.0, 1))
+        level = self.levels.setdefault('parts' if leaf else depth + 1, [0, 0.0])
+        level[1] += weight * count
+
+        size = 0 if self.expired else self.size(count)
+        if not size:
+            return []
+
+        random = Random(f'{self.seed}:{parent_id}')
+        if size == count:
+            indexes = range(count)
+        elif self.method == 'random':
+            indexes = sorted(random.sample(range(count), size))
+        else:
+            indexes = [random.randrange(count * i // size, count * (i + 1) // size) for i in range(size)]
+
+        selected = [items[index] for index in indexes]
+        level[0] += size
+
+        if not leaf:
+            child_weight = weight * count / size
+            for item in selected:
+                if item:
+                    self.nodes[item.get('id')] = (child_weight, depth + 1)
+
+        return selected
+
+    def coverage(self):
+        """
+        :return: {уровень: (выбрано, оценка размера, доля)}
+        """
+        coverage = {
+            level: (sampled, round(estimate), sampled / estimate if estimate else 1.0)
+            for level, (sampled, estimate) in sorted(self.levels.items(), key=lambda item: (item[0] == 'parts', item[0]))
+        }
+        if 'parts' in coverage:
+            estimate = self.levels['parts'][1]
+            coverage['validated'] = (self.validated, round(estimate), self.validated / estimate if estimate else 1.0)
+        return coverage
+
+    def __str__(self):
+        levels = ' '.join(
+            f"{level if isinstance(level, str) else f'depth{level}'} {sampled}/~{estimate} ({share:.1%})"
+            for level, (sampled, estimate, share) in self.coverage().items()
+        )
+        return f"{levels}{' time budget exceeded' if self.expired else ''}"
+
+
+def create_sampler(fraction=None, fanout=None, seed=0, method='random', time_budget=None):
+    """
+    :return: Sampler или None, если выборка не задана
+    """
+    if fraction is None and fanout is None and time_budget is None:
+        return None
+    return Sampler(fraction=fraction, fanout=fanout, seed=seed, method=method, time_budget=time_budget)
@@ -0,0 +1,42 @@
+class Schema:
+    """
+    Скомпилированный набор обязательных полей раздела: поле -> бит (поля по алфавиту).
+    Проверка записи - несколько поисков в словаре без создания множеств.
+    """
+
+    def __init__(self, fields):
+        self.fields = tuple(sorted(fields))
+        self.bits = tuple((field, 1 << bit) for bit, field in enumerate(self.fields))
+
+    def missing(self, data):
+        """
+        :return: Маска полей, отсутствующих в data (0 - все на месте)
+        """
+        mask = 0
+        for field, bit in self.bits:
+            if field not in data:
+                mask |= bit
+        return mask
+
+    def names(self, mask):
+        return {field for field, bit in self.bits if mask & bit}
+
+    def __len__(self):
+        return len(self.fields)
+
+    def __repr__(self):
+        return f"Schema{self.fields}"
+
+
+# Схемы всех классов категорий и деталей: имя класса -> {раздел: Schema}
+registry = dict()
+
+
+def compile_schemas(cls, sections):
+    """
+    Компилирует схемы класса один раз при его объявлении.
+    :param sections: {раздел: имя атрибута класса с обязательными полями}
+    """
+    schemas = {section: Schema(getattr(cls, attribute)) for section, attribute in sections.items()}
+    registry[cls.__name__] = schemas
+    return schemas
@@ -0,0 +1,203 @@
+import asyncio
+import multiprocessing
+import time
+from functools import partial
+from queue import Empty
+
+from database import fetch_detail_ranges, mark_detail_validated, flush_db
+from src.catalog.limiter import AdaptiveLimiter
+from src.catalog.metrics import metrics
+from src.catalog.schema import registry
+
+
+class ShardedValidation:
+    """
+    Проверка деталей каталога несколькими процессами. Детали делятся на диапазоны id (NTILE),
+    каждый процесс проверяет свой диапазон со своей HTTP-сессией и циклом событий и
+    отправляет результаты пачками в очередь. Родитель пишет их в базу единственным
+    писателем и обновляет прогресс. При выборочном обходе процессы получают срок окончания
+    time_budget и после него не проверяют детали.
+    """
+
+    def __init__(self, catalog, shards=4, pending_only=False, batch_size=500, progress=None):
+        self.catalog = catalog
+        self.shards = shards
+        self.pending_only = pending_only
+        self.batch_size = batch_size
+        self.progress = progress
+        self.stats = {
+            'shards': 0,
+            'parts': 0,
+            'validated': 0,
+            'findings': 0,
+            'errors': 0,
+        }
+
+    async def run(self):
+        await flush_db()
+        ranges = await fetch_detail_ranges(
+            catalog_name=self.catalog.name, shards=self.shards, pending_only=self.pending_only,
+        )
+        if not ranges:
+            return self.stats
+
+        # Общий лимит одновременных запросов делится между процессами
+        connections = max(1, self.catalog.limiter.max_limit // len(ranges))
+        deadline = self.deadline()
+        context = multiprocessing.get_context('spawn')
+        results = context.Queue()
+        processes = [
+            context.Process(
+                target=validate_shard,
+                args=(self.catalog.name, self.catalog.api_url, shard, first_id, last_id, self.pending_only,
+                      self.batch_size, connections, deadline, results),
+                daemon=True,
+            )
+            for shard, first_id, last_id, _ in ranges
+        ]
+        for process in processes:
+            process.start()
+        self.stats['shards'] = len(processes)
+
+        loop = asyncio.get_running_loop()
+        running = len(processes)
+        try:
+            while running:
+                try:
+                    message = await loop.run_in_executor(None, partial(results.get, timeout=1))
+                except Empty:
+                    if not any(process.is_alive() for process in processes):
+                        self.catalog.logger.error(f'{self.catalog} validation shards exited without result')
+                        break
+                    continue
+
+                kind, shard, *payload = message
+                if kind == 'batch':
+                    await self._handle_batch(*payload)
+                elif kind == 'error':
+                    self.stats['errors'] += 1
+                    self.catalog.logger.error(f'{self.catalog} validation shard {shard}: {payload[0]}')
+                elif kind == 'done':
+                    running -= 1
+                    retry_stats, snapshot = payload
+                    for key, value in retry_stats.items():
+                        setattr(self.catalog.retry_stats, key, getattr(self.catalog.retry_stats, key) + value)
+                    # Запросы, задержки и объём ответов процесса попадают в общие метрики запуска
+                    metrics.merge(snapshot)
+        finally:
+            for process in processes:
+                await loop.run_in_executor(None, process.join)
+            await flush_db()
+
+        return self.stats
+
+    def deadline(self):
+        """
+        Срок окончания выборочного обхода по системным часам: запуск процессов занимает
+        заметное время, поэтому передаётся момент, а не остаток.
+        :return: time.time() окончания time_budget или None без ограничения
+        """
+        sampler = self.catalog.sampler
+        if sampler is None or sampler.time_budget is None:
+            return None
+        return time.time() + sampler.time_budget - (time.monotonic() - sampler.started)
+
+    async def _handle_batch(self, count, validated, findings):
+        for detail_id in validated:
+            await mark_detail_validated(catalog_name=self.catalog.name, detail_id=detail_id)
+
+        for entity, entity_id, category_id, section, mask in findings:
+            schema = registry[f'{self.catalog.name.capitalize()}{entity.capitalize()}'][section]
+            await self.catalog.record_validation(entity, entity_id, category_id, section, schema, mask)
+
+        self.stats['parts'] += count
+        self.stats['validated'] += len(validated)
+        self.stats['findings'] += len(findings)
+        if self.progress is not None:
+            self.progress.update(count)
+
+    def __str__(self):
+        return ' '.join(f'{key} {value}' for key, value in self.stats.items())
+
+
+def validate_shard(catalog_name, api_url, shard, first_id, last_id, pending_only, batch_size, connections,
+                   deadline, results):
+    """
+    Точка входа процесса-обработчика.
+    :param deadline: time.time() окончания проверки (None - без ограничения)
+    """
+    asyncio.run(_validate_shard(
+        catalog_name, api_url, shard, first_id, last_id, pending_only, batch_size, connections, deadline,
+        results,
+    ))
+
+
+async def _validate_shard(catalog_name, api_url, shard, first_id, last_id, pending_only, batch_size, connections,
+                          deadline, results):
+    from database import fetch_parts_range, fetch_categories, close_db
+    from src.catalog.catalog import create_catalog_instance
+    from src.catalog.category import create_category_instance
+    from src.catalog.part import create_part_instance
+
+    catalog = await create_catalog_instance(catalog_name=catalog_name, log_suffix=f'_shard{shard}')
+    catalog.api_url = api_url
+    catalog.limiter = AdaptiveLimiter(max_limit=connections)
+    findings = []
+    catalog.validation_sink = findings.append
+
+    try:
+        categories = {
+            category_id: await create_category_instance(catalog=catalog, category_id=category_id, name=name)
+            for category_id, name in (await fetch_categories(catalog_name=catalog_name)).items()
+        }
+
+        def expired():
+            return deadline is not None and time.time() >= deadline
+
+        # Пачка проверяется не больше чем connections деталями сразу, чтобы срок
+        # проверялся перед каждой деталью, а не один раз при запуске пачки
+        gate = asyncio.Semaphore(connections)
+
+        async def load(part):
+            async with gate:
+                # Непроверенные после срока детали остаются в очереди для --resume
+                if expired():
+                    return None
+                return await part.load()
+
+        after_id = first_id - 1
+        while not expired():
+            rows = await fetch_parts_range(
+                catalog_name=catalog_name, batch_size=batch_size, after_id=after_id, last_id=last_id,
+                pending_only=pending_only,
+            )
+            if not rows:
+                break
+
+            parts = [
+                await create_part_instance(
+                    catalog=catalog, category=categories.get(category_id), part_id=detail_id, name=name,
+                )
+                for detail_id, name, category_id in rows
+            ]
+            loaded = [
+                (part, response.get('data'))
+                for part, response in zip(parts, await asyncio.gather(*(load(part) for part in parts)))
+                if response
+            ]
+
+            # Данные пачки проверяются одним вызовом, результаты пишутся по деталям
+            checked = [(part, data) for part, data in loaded if data]
+            for (part, _), part_findings in zip(checked, type(parts[0]).check_batch([data for _, data in checked])):
+                if part_findings:
+                    await part.report(part_findings)
+
+            results.put(('batch', shard, len(rows), [part.id for part, _ in loaded], list(findings)))
+            findings.clear()
+            after_id = rows[-1][0]
+    except Exception as error:
+        results.put(('error', shard, repr(error)))
+    finally:
+        await catalog.close()
+        await close_db()
+        results.put(('done', shard, catalog.retry_stats.as_dict(), metrics.snapshot()))
@@ -0,0 +1,130 @@
+import asyncio
+from itertools import count
+
+from database import add_crawl_node, mark_node_expanded, add_crawl_fingerprint, reset_parts_list_fetched
+
+
+class Traversal:
+    """
+    Обход дерева категорий фиксированным числом обработчиков по общей очереди
+    (категория, глубина). Порядок: 'breadth' - в ширину, 'depth' - сначала глубокие
+    узлы, либо функция priority(category, depth). При заполнении очереди до max_frontier
+    узел раскрывается сразу в текущем обработчике, что ограничивает память.
+    С checkpoint=True найденные и раскрытые узлы записываются в crawl_nodes, а их отпечатки
+    в crawl_fingerprints. Если переданы fingerprints прошлого обхода, поддеревья узлов
+    с неизменным отпечатком пропускаются, а у перечней изменённых узлов сбрасываются
+    контрольные точки, чтобы их детали были получены заново.
+    """
+
+    def __init__(self, catalog, test_api=False, workers=16, order='breadth', max_frontier=10000,
+                 on_category=None, on_parts_list=None, checkpoint=False, fingerprints=None):
+        self.catalog = catalog
+        self.test_api = test_api
+        self.workers = workers
+        self.max_frontier = max_frontier
+        self.on_category = on_category
+        self.on_parts_list = on_parts_list
+        self.checkpoint = checkpoint
+        self.fingerprints = fingerprints
+
+        if order == 'breadth':
+            self.priority = lambda category, depth: depth
+        elif order == 'depth':
+            self.priority = lambda category, depth: -depth
+        elif callable(order):
+            self.priority = order
+        else:
+            raise ValueError(f"Unknown traversal order {order}")
+
+        self.frontier = asyncio.PriorityQueue()
+        self._counter = count()
+        self.stats = {
+            'categories': 0,
+            'parts_lists': 0,
+            'inline': 0,
+            'unchanged': 0,
+            'max_frontier': 0,
+            'errors': 0,
+        }
+
+    async def add(self, category, depth=1):
+        await self._record(category, depth)
+        self.frontier.put_nowait((self.priority(category, depth), next(self._counter), category, depth))
+        self.stats['max_frontier'] = max(self.stats['max_frontier'], self.frontier.qsize())
+
+    async def _record(self, category, depth):
+        if self.checkpoint:
+            await add_crawl_node(
+                catalog_name=self.catalog.name,
+                category_id=category.id,
+                name=category.name,
+                root_id=getattr(category, 'root_id', None),
+                depth=depth,
+            )
+
+    async def run(self, roots=()):
+        for root in roots:
+            await self.add(root)
+
+        workers = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        try:
+            await self.frontier.join()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+        return self.stats
+
+    async def _worker(self):
+        while True:
+            _, _, category, depth = await self.frontier.get()
+            try:
+                await self.expand(category, depth)
+            except Exception as error:
+                self.stats['errors'] += 1
+                self.catalog.logger.error(f'{self.catalog} traversal {category}: {error}')
+            finally:
+                self.frontier.task_done()
+
+    async def expand(self, category, depth):
+        if depth > self.catalog.depth:
+            return
+
+        part_list = depth == self.catalog.depth and self.catalog.part_list
+        children = [child async for child in category.fetch_children(test_api=self.test_api, part_list=part_list) if child]
+
+        if category.loaded:
+            if self.checkpoint:
+                await add_crawl_fingerprint(
+                    catalog_name=self.catalog.name,
+                    category_id=category.id,
+                    fingerprint=category.fingerprint,
+                )
+
+            if self.fingerprints is not None and self.fingerprints.get(category.id) == category.fingerprint:
+                self.stats['unchanged'] += 1
+                children = []
+
+        for child in children:
+            if depth == self.catalog.depth:
+                self.stats['parts_lists'] += 1
+                if self.fingerprints is not None:
+                    await reset_parts_list_fetched(catalog_name=self.catalog.name, parts_list_id=child.id)
+                if self.on_parts_list is not None:
+                    await self.on_parts_list(child, category)
+                continue
+
+            self.stats['categories'] += 1
+            if self.on_category is not None:
+                await self.on_category(child, category)
+
+            if self.frontier.qsize() >= self.max_frontier:
+                self.stats['inline'] += 1
+                await self._record(child, depth + 1)
+                await self.expand(child, depth + 1)
+            else:
+                await self.add(child, depth + 1)
+
+        if self.checkpoint and category.loaded:
+            await mark_node_expanded(catalog_name=self.catalog.name, category_id=category.id)
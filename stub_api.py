@@ -0,0 +1,330 @@
+"""
+Локальная заглушка API detalum для нагрузочных тестов.
+Дерево каждого каталога строится арифметически по его форме (depth, part_list, name_label_category),
+поэтому даже каталоги на миллионы деталей не хранятся в памяти.
+
+Запуск:
+    python stub_api.py --port 8081 --roots 10 --fanout 10 --parts 100 --latency 0.02 --error_rate 0.01
+    PARTSTEST_API_URL=http://127.0.0.1:8081/api/v1 python main.py
+"""
+import argparse
+import asyncio
+import random
+
+from aiohttp import web
+
+from src.catalog import catalog as catalog_module, category as category_module, part as part_module
+
+CATALOGS = ('lemken', 'kubota', 'grimme', 'claas', 'krone', 'kverneland', 'jdeere', 'ropa')
+TIMESTAMP = '2024-01-01T00:00:00.000000Z'
+# Диапазон идентификаторов каталога: перечни и детали в базе имеют общий для всех каталогов ключ
+ID_SPACE = 10 ** 9
+# Смещение идентификаторов групп (элементов ответа с полем children), чтобы они не пересекались с узлами
+GROUP_OFFSET = 10 ** 12
+
+
+class TreeShape:
+    """
+    Форма дерева каталога.
+    :param roots: Число корневых категорий
+    :param fanout: Число потомков в каждой группе ответа (в плоских ответах - у узла)
+    :param groups: Число групп в ответе категории для каталогов без part_list
+    :param parts: Число деталей в перечне
+    """
+
+    def __init__(self, roots=5, fanout=5, groups=1, parts=20):
+        self.roots = roots
+        self.fanout = fanout
+        self.groups = groups
+        self.parts = parts
+
+
+class StubCatalog:
+    """
+    Синтетический каталог. Уровни 1..depth - категории, уровень depth + 1 - перечни деталей,
+    за ними следуют детали. Идентификаторы уровня идут подряд, поэтому по id узла
+    вычисляются его уровень, номер, родитель и потомки.
+    """
+
+    def __init__(self, name, shape, first_id=1, missing_rate=0.0, seed=None):
+        catalog_cls = getattr(catalog_module, f'{name.capitalize()}Catalog')
+        self.name = name
+        self.shape = shape
+        self.depth = catalog_cls.depth
+        self.part_list = catalog_cls.part_list
+        self.name_label = catalog_cls.name_label_category
+        # Grimme отдаёт потомков плоским списком, а детали перечня - по адресу категории
+        self.flat = catalog_cls.name_label_category == 'label'
+        self.missing_rate = missing_rate
+        self.random = random.Random(seed)
+
+        category = getattr(category_module, f'{name.capitalize()}Category')
+        part = getattr(part_module, f'{name.capitalize()}Part')
+        self.category_fields = category.validation_fields | {'id', self.name_label}
+        self.category_image_fields = category.validation_image_fields
+        self.part_fields = part.validation_fields | {'id', 'name', 'category'}
+        self.part_image_fields = part.validation_image_fields
+
+        self.bases = [None, first_id]
+        self.counts = [None, shape.roots]
+        for level in range(2, self.depth + 2):
+            self.bases.append(self.bases[-1] + self.counts[-1])
+            self.counts.append(self.counts[-1] * self.width(level - 1))
+        self.parts_base = self.bases[-1] + self.counts[-1]
+
+    @property
+    def total_parts(self):
+        return self.counts[self.depth + 1] * self.shape.parts
+
+    def width(self, level):
+        """
+        Число потомков узла уровня level.
+        """
+        if self.flat or (level == self.depth and self.part_list):
+            return self.shape.fanout
+        return self.shape.fanout * self.shape.groups
+
+    def locate(self, node_id):
+        """
+        :return: (уровень, номер на уровне) или None
+        """
+        for level in range(1, self.depth + 2):
+            index = node_id - self.bases[level]
+            if 0 <= index < self.counts[level]:
+                return level, index
+        return None
+
+    def node_id(self, level, index):
+        return self.bases[level] + index
+
+    def children(self, level, index):
+        width = self.width(level)
+        return [self.node_id(level + 1, index * width + i) for i in range(width)]
+
+    def parent_id(self, level, index):
+        if level == 1:
+            return None
+        return self.node_id(level - 1, index // self.width(level - 1))
+
+    def _fields(self, fields, image_fields, values):
+        record = {field: values.get(field) for field in fields}
+        if 'imageFields' in record:
+            record['imageFields'] = {field: f'{values["id"]}.png' for field in image_fields}
+        # Поля, по которым обходчик строит дерево, не удаляются
+        if self.missing_rate and self.random.random() < self.missing_rate:
+            record.pop(self.random.choice(sorted(fields - {'id', 'name', 'label', 'children'})), None)
+        return record
+
+    def category_record(self, node_id, children=()):
+        level, index = self.locate(node_id)
+        return self._fields(self.category_fields, self.category_image_fields, {
+            'id': node_id,
+            self.name_label: f'{self.name} {level}.{index}',
+            'parent_id': self.parent_id(level, index),
+            'link_type': 'category',
+            'linkType': 'category',
+            'children': list(children),
+            'created_at': TIMESTAMP,
+            'updated_at': TIMESTAMP,
+            'position': index,
+            'description': '',
+            'remark': '',
+        })
+
+    def tree(self):
+        return [self.category_record(self.node_id(1, index)) for index in range(self.shape.roots)]
+
+    def category(self, node_id):
+        """
+        Ответ /catalog/{id}: потомки узла (группами или плоским списком), для перечня Grimme - его детали.
+        """
+        location = self.locate(node_id)
+        if location is None:
+            return None
+
+        level, index = location
+        if level > self.depth:
+            return self.parts_list(node_id) if self.flat else []
+
+        children = [self.category_record(child_id) for child_id in self.children(level, index)]
+        if self.flat or (level == self.depth and self.part_list):
+            return children
+
+        fanout = self.shape.fanout
+        groups = []
+        for group in range(self.shape.groups):
+            record = self.category_record(node_id, children[group * fanout:(group + 1) * fanout])
+            record['id'] = GROUP_OFFSET + node_id * self.shape.groups + group
+            groups.append(record)
+        return groups
+
+    def parts_list(self, node_id):
+        location = self.locate(node_id)
+        if location is None or location[0] != self.depth + 1:
+            return None
+
+        first = self.parts_base + location[1] * self.shape.parts
+        return [self.part_record(part_id) for part_id in range(first, first + self.shape.parts)]
+
+    def part_record(self, part_id):
+        index = part_id - self.parts_base
+        if not 0 <= index < self.total_parts:
+            return None
+
+        list_id = self.node_id(self.depth + 1, index // self.shape.parts)
+        number = f'{self.name[:2].upper()}{part_id:09d}'
+        return self._fields(self.part_fields, self.part_image_fields, {
+            'id': part_id,
+            'name': f'{self.name} part {index}',
+            'link_type': 'part',
+            'quantity': 1,
+            'part_number': number,
+            'partNumber': number,
+            'position': index % self.shape.parts,
+            'dimension': '',
+            's3_image_name': f'{part_id}.png',
+            'category': {'id': list_id},
+            'created_at': TIMESTAMP,
+            'updated_at': TIMESTAMP,
+        })
+
+
+class StubApi:
+    """
+    Сервер заглушки. Каждому запросу добавляется задержка latency ± jitter,
+    с вероятностью slow_rate - ещё slow_latency (медленный хвост), с вероятностью
+    error_rate вместо ответа возвращается 429 или 5xx.
+    """
+    error_statuses = (429, 500, 502, 503)
+
+    def __init__(self, catalogs, latency=0.0, jitter=0.0, slow_rate=0.0, slow_latency=1.0, error_rate=0.0,
+                 seed=None):
+        self.catalogs = {stub.name: stub for stub in catalogs}
+        self.latency = latency
+        self.jitter = jitter
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.errors = 0
+
+    def app(self):
+        app = web.Application(middlewares=[self._inject])
+        app.add_routes([
+            web.get('/api/v1/brand', self.brand),
+            web.get('/api/v1/{catalog}/catalog/tree', self.tree),
+            web.get('/api/v1/{catalog}/catalog/{id:\\d+}', self.category),
+            web.get('/api/v1/{catalog}/catalog/{id:\\d+}/parts', self.parts),
+            web.get('/api/v1/{catalog}/part/{id:\\d+}', self.part),
+        ])
+        return app
+
+    @web.middleware
+    async def _inject(self, request, handler):
+        self.requests += 1
+        delay = self.latency + self.random.uniform(-self.jitter, self.jitter)
+        if self.slow_rate and self.random.random() < self.slow_rate:
+            delay += self.slow_latency
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        if self.error_rate and self.random.random() < self.error_rate:
+            self.errors += 1
+            status = self.random.choice(self.error_statuses)
+            headers = {'Retry-After': '1'} if status == 429 else None
+            return web.json_response({'message': 'stub error'}, status=status, headers=headers)
+
+        return await handler(request)
+
+    def _catalog(self, request):
+        stub = self.catalogs.get(request.match_info['catalog'])
+        if stub is None:
+            raise web.HTTPNotFound()
+        return stub
+
+    @staticmethod
+    def _respond(data):
+        if data is None:
+            raise web.HTTPNotFound()
+        return web.json_response({'data': data})
+
+    async def brand(self, request):
+        return self._respond([
+            {'id': number, 'label': name.capitalize(), 'slug': name}
+            for number, name in enumerate(self.catalogs, start=1)
+        ])
+
+    async def tree(self, request):
+        return self._respond(self._catalog(request).tree())
+
+    async def category(self, request):
+        return self._respond(self._catalog(request).category(int(request.match_info['id'])))
+
+    async def parts(self, request):
+        return self._respond(self._catalog(request).parts_list(int(request.match_info['id'])))
+
+    async def part(self, request):
+        return self._respond(self._catalog(request).part_record(int(request.match_info['id'])))
+
+    async def start(self, host='127.0.0.1', port=8081):
+        """
+        Запускает сервер в текущем цикле событий.
+        :return: AppRunner (остановка - await runner.cleanup())
+        """
+        runner = web.AppRunner(self.app(), access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        return runner
+
+
+def create_stub_api(catalogs=CATALOGS, roots=5, fanout=5, groups=1, parts=20, missing_rate=0.0, seed=None, **kwargs):
+    shape = TreeShape(roots=roots, fanout=fanout, groups=groups, parts=parts)
+    stubs = [
+        StubCatalog(name, shape, first_id=1 + number * ID_SPACE, missing_rate=missing_rate, seed=seed)
+        for number, name in enumerate(catalogs)
+    ]
+    return StubApi(stubs, seed=seed, **kwargs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local detalum API stand-in')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--catalogs', default=','.join(CATALOGS), help='Example: lemken,grimme')
+    parser.add_argument('--roots', type=int, default=5, help='Root categories per catalog')
+    parser.add_argument('--fanout', type=int, default=5, help='Children per group')
+    parser.add_argument('--groups', type=int, default=1, help='Groups per category response')
+    parser.add_argument('--parts', type=int, default=20, help='Parts per parts list')
+    parser.add_argument('--latency', type=float, default=0.0, help='Response delay (seconds)')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Random delay spread (seconds)')
+    parser.add_argument('--slow_rate', type=float, default=0.0, help='Share of slow responses')
+    parser.add_argument('--slow_latency', type=float, default=1.0, help='Extra delay of slow responses (seconds)')
+    parser.add_argument('--error_rate', type=float, default=0.0, help='Share of 429/5xx responses')
+    parser.add_argument('--missing_rate', type=float, default=0.0, help='Share of records with a dropped field')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    api = create_stub_api(
+        catalogs=args.catalogs.split(','),
+        roots=args.roots,
+        fanout=args.fanout,
+        groups=args.groups,
+        parts=args.parts,
+        missing_rate=args.missing_rate,
+        seed=args.seed,
+        latency=args.latency,
+        jitter=args.jitter,
+        slow_rate=args.slow_rate,
+        slow_latency=args.slow_latency,
+        error_rate=args.error_rate,
+    )
+
+    for stub in api.catalogs.values():
+        print(f'{stub.name}: depth {stub.depth} parts lists {stub.counts[stub.depth + 1]} parts {stub.total_parts}')
+
+    web.run_app(api.app(), host=args.host, port=args.port, access_log=None)
+
+
+if __name__ == '__main__':
+    main()
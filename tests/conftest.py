@@ -1,3 +1,4 @@
+import os
 import pytest
 
 
@@ -11,6 +12,119 @@ def pytest_addoption(parser):
         action='store_true',  # Если это просто флаг, который включается
         help='Enable API testing',
     )
+    parser.addoption(
+        '--resume',
+        action='store_true',
+        help='Continue an interrupted crawl from its checkpoints',
+    )
+    parser.addoption(
+        '--incremental',
+        action='store_true',
+        help='Descend only into subtrees changed since the previous crawl',
+    )
+    parser.addoption(
+        '--pipeline',
+        action='store_true',
+        help='Run test_pipeline: the whole crawl again as one pipeline (skipped by default)',
+    )
+    parser.addoption(
+        '--sample',
+        type=float,
+        help='Sampling mode: share of children of every node to crawl, e.g. 0.05',
+    )
+    parser.addoption(
+        '--sample_fanout',
+        type=int,
+        help='Sampling mode: at most N children of every node',
+    )
+    parser.addoption(
+        '--sample_method',
+        choices=('random', 'stratified'),
+        default='random',
+        help='random: seeded random children, stratified: one child from each equal part of the list',
+    )
+    parser.addoption(
+        '--sample_seed',
+        type=int,
+        default=0,
+        help='Seed of the sampling selection',
+    )
+    parser.addoption(
+        '--time_budget',
+        type=float,
+        help='Sampling mode: stop expanding the tree and validating parts after N seconds',
+    )
+    parser.addoption(
+        '--tree_workers',
+        type=int,
+        help='Concurrent tree traversal workers (default: the maximum limiter window)',
+    )
+    parser.addoption(
+        '--validation_shards',
+        type=int,
+        default=0,
+        help='Validate parts of a catalog in N worker processes split by detail id ranges',
+    )
+    parser.addoption(
+        '--api_url',
+        default=os.environ.get('PARTSTEST_API_URL'),
+        help='Base API url, e.g. of the local stub: http://127.0.0.1:8081/api/v1',
+    )
+    parser.addoption(
+        '--metrics_dir',
+        default='metrics',
+        help='Directory for the Prometheus (.prom) and JSON metrics written at the end of the run',
+    )
+    parser.addoption(
+        '--cassette',
+        default=os.environ.get('PARTSTEST_CASSETTE'),
+        help='Path of the recorded responses archive',
+    )
+    parser.addoption(
+        '--cassette_mode',
+        choices=('record', 'replay'),
+        default=os.environ.get('PARTSTEST_CASSETTE_MODE', 'replay'),
+        help='record: save API responses, replay: serve them from the archive',
+    )
+    parser.addoption(
+        '--replay_latency',
+        type=float,
+        default=float(os.environ.get('PARTSTEST_REPLAY_LATENCY', 0)),
+        help='Simulated latency of replayed responses (seconds)',
+    )
+
+
+def pytest_collection_modifyitems(config, items):
+    # Конвейер повторяет весь обход каталога, поэтому выполняется только по запросу
+    if config.getoption('pipeline'):
+        return
+    skip = pytest.mark.skip(reason='the pipeline crawl runs only with --pipeline')
+    for item in items:
+        if item.originalname == 'test_pipeline':
+            item.add_marker(skip)
+
+
+def pytest_sessionstart(session):
+    # main.py запускает pytest.main повторно в одном процессе
+    from src.catalog.metrics import metrics
+    metrics.clear()
+
+
+def pytest_sessionfinish(session):
+    from src.catalog.metrics import metrics
+    if metrics.counters or metrics.histograms:
+        metrics.write(directory=session.config.getoption('metrics_dir'))
+
+
+def attach_metrics(catalog):
+    try:
+        import allure
+    except ImportError:
+        return
+
+    from src.catalog.metrics import metrics
+    allure.attach(metrics.to_prometheus(catalog=catalog.name), name=f'{catalog} metrics.prom',
+                  attachment_type=allure.attachment_type.TEXT)
 
 
 def pytest_generate_tests(metafunc):
@@ -29,10 +143,40 @@ def pytest_generate_tests(metafunc):
 async def catalog(request):
     catalog_name = request.param
     from src.catalog.catalog import create_catalog_instance
+    from src.catalog.sampling import create_sampler
     catalog = await create_catalog_instance(catalog_name=catalog_name)
+    catalog.resume = request.config.getoption('resume')
+    catalog.incremental = request.config.getoption('incremental')
+    catalog.validation_shards = request.config.getoption('validation_shards')
+    catalog.tree_workers = request.config.getoption('tree_workers')
+    catalog.sampler = create_sampler(
+        fraction=request.config.getoption('sample'),
+        fanout=request.config.getoption('sample_fanout'),
+        seed=request.config.getoption('sample_seed'),
+        method=request.config.getoption('sample_method'),
+        time_budget=request.config.getoption('time_budget'),
+    )
+
+    if request.config.getoption('api_url'):
+        catalog.api_url = request.config.getoption('api_url').rstrip('/')
+
+    if request.config.getoption('cassette'):
+        from src.catalog.cassette import Cassette
+        catalog.cassette = await Cassette(
+            path=request.config.getoption('cassette'),
+            mode=request.config.getoption('cassette_mode'),
+            latency=request.config.getoption('replay_latency'),
+        ).open()
+
     from database import add_catalog
     await add_catalog(name=catalog_name)
-    return catalog
+    yield catalog
+    attach_metrics(catalog)
+    await catalog.close()
+    if catalog.cassette is not None:
+        await catalog.cassette.close()
+    from database import close_db
+    await close_db()
 
 
 @pytest.fixture(scope='module')
@@ -1,18 +1,11 @@
-import asyncio
 from abc import ABC, abstractmethod
-from random import randint
-import nest_asyncio
 import pytest
 from colorama import Fore
 from tqdm.asyncio import tqdm
-from src.catalog.category import create_category_instance
-from src.catalog.part import create_part_instance
+from src.catalog.crawler import Crawler
+from src.catalog.pipeline import Pipeline
 from tests.conftest import catalog
-from utility import update_spinner
-from database import add_parts_list, count_parts_list, count_parts, fetch_all_parts_lists, fetch_parts_lists_batch, \
-    fetch_parts
-
-nest_asyncio.apply()
+from database import crawl_summary, flush_db, validation_report, count_parts_lists_by_category, fetch_categories
 
 
 class NoDataException(Exception):
@@ -23,200 +16,119 @@ class NoDataException(Exception):
 
 class CatalogTestUtility:
 
-    async def process_children(self, catalog, category, test_api, t, depth=1):
-        if depth > catalog.depth:
-            return
-
-        part_list = False
-
-        if depth == catalog.depth and catalog.part_list:
-            part_list = True
-
-        async for child in category.fetch_children(test_api=test_api, part_list=part_list):
-            if child:
-                t.total = t.n * randint(2, 3)
-                t.set_postfix_str('...' * randint(1, 2))
-                if depth == catalog.depth:
-                    t.set_postfix_str(f'{child} from {category}')
-                    t.update()
-                    await add_parts_list(
-                        root_id=child.root_id,
-                        parts_list_id=child.id,
-                        name=child.name,
-                        catalog_name=catalog.name,
-                    )
-
-                await self.process_children(catalog=catalog, category=child, test_api=test_api, t=t, depth=depth+1)
+    @staticmethod
+    async def write_summary(catalog):
+        summary = await crawl_summary(catalog_name=catalog.name)
+        tqdm.write(Fore.CYAN + f'Summary {catalog}: ' + ', '.join(f'{key} {value}' for key, value in summary.items()))
 
-    async def process_fetch_parts_from_parts_lists(self, category_id, count, catalog_name):
-        if 0 < count < 50:
-            parts_lists = await fetch_all_parts_lists(category_id=category_id, catalog_name=catalog_name)
-            yield parts_lists
+    @staticmethod
+    def write_coverage(catalog):
+        if catalog.sampler is not None:
+            tqdm.write(Fore.CYAN + f'Sample coverage {catalog}: {catalog.sampler}')
 
-        elif count >= 50:
-            batch_size = 50
+    @staticmethod
+    async def write_validation_report(catalog):
+        await flush_db()
+        for entity, section, field, count in await validation_report(catalog_name=catalog.name):
+            tqdm.write(Fore.YELLOW + f'Missing {catalog} {entity} {section}.{field}: {count}')
 
-            for offset in range(0, count, batch_size):
-                batch = await fetch_parts_lists_batch(category_id=category_id, batch_size=batch_size, offset=offset, catalog_name=catalog_name)
-                yield batch
+        categories = await fetch_categories(catalog_name=catalog.name)
+        for category_id, entity, section, field, count in await validation_report(catalog_name=catalog.name,
+                                                                                 by_category=True):
+            category = categories.get(category_id, category_id)
+            tqdm.write(Fore.YELLOW + f'Missing {catalog}/{category} {entity} {section}.{field}: {count}')
 
 
 class TestCatalogBase(ABC, CatalogTestUtility):
+    """
+    Этапы обхода выполняет Crawler (src/catalog/crawler.py), тесты только показывают прогресс и итоги.
+    """
 
     async def test_root_categories(self, catalog, test_api):
-        spinner = tqdm(total=0, bar_format="{desc}", ncols=30)
-        spinner_text = Fore.CYAN + 'Receive categories data'
-        spinner_event = asyncio.Event()
-        spinner_task = asyncio.create_task(update_spinner(spin=spinner, spin_text=spinner_text, spin_event=spinner_event))
+        t = tqdm(
+            total=0,
+            desc='Process root categories',
+            bar_format="{desc} | {elapsed} | : {bar:30} | {n_fmt}/{total_fmt} | {postfix}",
+            postfix=f'Receive categories from {catalog}',
+        )
 
         try:
-            resp_json = await catalog.fetch_tree()
+            await Crawler(catalog=catalog, test_api=test_api).roots(progress=t)
         finally:
-            spinner_event.set()
-            await spinner_task
-            spinner.set_description(Fore.CYAN + 'Loaded data categories')
-            spinner.close()
-
-        if resp_json:
-            data = resp_json.get('data')
-
-            if data:
-                t = tqdm(
-                    total=len(data),
-                    desc='Process root categories',
-                    bar_format="{desc} | {elapsed} | : {bar:30} | {n_fmt}/{total_fmt} | {postfix}",
-                    postfix=f'Receive categories from {catalog}',
-                )
-
-                async def process_category(category_data, catalog):
-                    category = await catalog.add_category(data=category_data)
-                    t.set_postfix_str(f'{category} from {catalog}')
-                    await category.validate(data=category_data)
-
-                tasks = (asyncio.create_task(process_category(category_data=category_data, catalog=catalog)) for category_data in data)
-                try:
-                    for task in asyncio.as_completed(tasks):
-                        await task
-                        t.update()
-                        await asyncio.sleep(0.1)
-                finally:
-                    t.close()
-            else:
-                catalog.logger.warning(f'No data in {catalog.current_url} catalog: {catalog}')
+            t.close()
 
     @abstractmethod
     async def test_tree(self, catalog, test_api):
-        if catalog.categories:
-            categories = list(catalog.categories.values())
-            t = tqdm(
-                dynamic_ncols=True,
-                total=None,
-                desc='Process tree traversal and parlists retrieval',
-                bar_format="{desc} | {elapsed} | : {bar:30} | {n_fmt} | {postfix}",
-            )
-            tasks = (asyncio.create_task(self.process_children(catalog=catalog, category=category, test_api=test_api, t=t)) for category in categories)
-
-            try:
-                for task in asyncio.as_completed(tasks):
-                    await task
-            except Exception as error:
-                catalog.logger.error(error)
-            finally:
-                t.total = t.n
-                t.close()
-        else:
-            catalog.logger.warning(f'No Categories in {catalog}')
+        t = tqdm(
+            dynamic_ncols=True,
+            total=None,
+            desc='Process tree traversal and parlists retrieval',
+            bar_format="{desc} | {elapsed} | : {bar:30} | {n_fmt} | {postfix}",
+        )
+
+        try:
+            await Crawler(catalog=catalog, test_api=test_api).tree(progress=t)
+        finally:
+            t.total = t.n
+            t.set_postfix_str(f'{catalog.limiter} {catalog.retry_stats} {catalog.cache}')
+            t.close()
 
     async def test_parts(self, catalog, test_api):
-        categories = list(catalog.categories.values())
+        crawler = Crawler(catalog=catalog, test_api=test_api)
 
         t = tqdm(
             dynamic_ncols=True,
             total=0,
             desc='Process fetch parts',
             bar_format="{desc} | {elapsed} | : {bar:30} | {n_fmt} | {postfix}",
+            postfix=f'{sum((await count_parts_lists_by_category(catalog_name=catalog.name)).values())} parts lists from {catalog}',
         )
 
-        async def _process_batch_fetch_parts(parts_list_data, obj_catalog, obj_category, progress):
-            parts_list_id, name, root_id = parts_list_data
-
-            parts_list = await create_category_instance(
-                catalog=obj_catalog,
-                category_id=parts_list_id,
-                name=name,
-                root_id=root_id,
-            )
-            await parts_list.fetch_parts(category=obj_category, test_api=test_api, t=progress)
-
         try:
-            for category in categories:
-                count = await count_parts_list(category_id=category.id, catalog_name=catalog.name)
-                async for parts_lists in self.process_fetch_parts_from_parts_lists(category_id=category.id, count=count, catalog_name=catalog.name):
-                    tasks = (asyncio.create_task(_process_batch_fetch_parts(
-                        parts_list_data=parts_list_data,
-                        obj_catalog=catalog,
-                        obj_category=category,
-                        progress=t)
-                    ) for parts_list_data in parts_lists)
-
-                    for task in asyncio.as_completed(tasks):
-                        result = await task
-
-                        if result and test_api:
-                            return
-        except Exception as error:
-            catalog.logger.error(error)
+            await crawler.parts(progress=t)
         finally:
             t.total = t.n
             t.close()
 
-        total_parts = 0
-        for category in categories:
-            total_parts += await count_parts(category_id=category.id, catalog_name=catalog.name)
-
         t = tqdm(
             dynamic_ncols=True,
-            total=total_parts,
+            total=0,
             desc='Process validation details',
             bar_format="{desc} | {elapsed} | : {bar:30} | {n_fmt}/{total_fmt} | {postfix}",
         )
 
-        async def _process_validation(part_data, obj_catalog, obj_category, progress, semaphore):
-            async with semaphore:
-                detail_id, name, _ = part_data
-                part = await create_part_instance(
-                    catalog=obj_catalog,
-                    category=obj_category,
-                    part_id=detail_id,
-                    name=name,
-                )
-                await part.validate(progress=progress)
+        try:
+            await crawler.validate(progress=t)
+        finally:
+            t.set_postfix_str(f'{catalog.limiter} {catalog.retry_stats} {catalog.cache}')
+            t.close()
+
+            await self.write_summary(catalog)
+            self.write_coverage(catalog)
+            await self.write_validation_report(catalog)
 
-        semaphore = asyncio.Semaphore(200)
+    async def test_pipeline(self, catalog, test_api):
+        t = tqdm(
+            dynamic_ncols=True,
+            total=0,
+            desc='Process catalog pipeline',
+            bar_format="{desc} | {elapsed} | : {bar:30} | {n_fmt}/{total_fmt} | {postfix}",
+        )
+        pipeline = Pipeline(catalog=catalog, test_api=test_api, progress=t)
 
         try:
-            for category in categories:
-                parts = await fetch_parts(category_id=category.id, catalog_name=catalog.name)
-
-                if parts:
-                    tasks = [asyncio.create_task(_process_validation(
-                        part_data=part_data,
-                        obj_catalog=catalog,
-                        obj_category=category,
-                        progress=t,
-                        semaphore=semaphore,
-                    )) for part_data in parts]
-
-                    for task in asyncio.as_completed(tasks):
-                        await task
-
-                    if test_api:
-                        return
+            await pipeline.run()
         except Exception as error:
             catalog.logger.error(error)
         finally:
+            t.set_postfix_str(f'{catalog.limiter} {catalog.retry_stats} {catalog.cache}')
             t.close()
 
+        tqdm.write(Fore.CYAN + f'Pipeline {catalog}: {pipeline}')
+        await self.write_summary(catalog)
+        self.write_coverage(catalog)
+        await self.write_validation_report(catalog)
+
 
 class TestLemkenCatalog(TestCatalogBase):
 
@@ -292,6 +204,10 @@ class TestCatalog:
         instance = self._get_test_instance(catalog)
         await instance.test_parts(catalog, test_api)
 
+    async def test_pipeline(self, catalog, test_api):
+        instance = self._get_test_instance(catalog)
+        await instance.test_pipeline(catalog, test_api)
+
 
 
 
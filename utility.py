@@ -1,5 +1,9 @@
 from itertools import cycle
 import asyncio
+import os
+
+# Адрес API, переопределяется переменной окружения (например, для локальной заглушки stub_api.py)
+API_URL = os.environ.get('PARTSTEST_API_URL', 'http://api.catalog.detalum.ru/api/v1')
 
 
 async def update_spinner(spin, spin_text, spin_event):